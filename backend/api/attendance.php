@@ -11,11 +11,13 @@ require_once __DIR__ . '/../config/cors.php';
 require_once __DIR__ . '/../helpers/Response.php';
 require_once __DIR__ . '/../helpers/Validator.php';
 require_once __DIR__ . '/../helpers/NotificationHelper.php';
+require_once __DIR__ . '/../helpers/AttendanceSummaryHelper.php';
 require_once __DIR__ . '/../middleware/auth.php';
 
 $database = new Database();
 $db = $database->getConnection();
 $notificationHelper = new NotificationHelper($db);
+$summaryHelper = new AttendanceSummaryHelper($db);
 
 $method = $_SERVER['REQUEST_METHOD'];
 $uri = $_SERVER['REQUEST_URI'];
@@ -178,6 +180,7 @@ if ($method === 'POST' && strpos($uri, '/checkin') !== false) {
         
         // Lấy dữ liệu vừa tạo để trả về
         $attendanceId = $db->lastInsertId();
+        $summaryHelper->refresh($employeeId, $date);
         $stmt = $db->prepare("
             SELECT * FROM attendance WHERE attendance_id = ?
         ");
@@ -231,6 +234,7 @@ if ($method === 'POST' && strpos($uri, '/checkout') !== false) {
         ");
         
         $stmt->execute([$time, $actualHours, $overtimeHours, $attendance['attendance_id']]);
+        $summaryHelper->refresh($employeeId, $date);
         
         // Lấy dữ liệu đầy đủ sau khi update để trả về
         $stmt = $db->prepare("
@@ -270,9 +274,11 @@ if ($method === 'POST' && !strpos($uri, '/checkin') && !strpos($uri, '/checkout'
             $data['status'] ?? 'present',
             $data['notes'] ?? null
         ]);
+        $attendanceId = $db->lastInsertId();
+        $summaryHelper->refresh($data['employee_id'], $data['attendance_date']);
         
         Response::created([
-            'attendance_id' => $db->lastInsertId()
+            'attendance_id' => $attendanceId
         ], 'Attendance created successfully');
         
     } catch (PDOException $e) {
@@ -324,6 +330,7 @@ if ($method === 'PUT' && preg_match('/\/attendance\/(\d+)/', $uri, $matches)) {
             $data['notes'] ?? null,
             $attendanceId
         ]);
+        $summaryHelper->refresh($oldAttendance['employee_id'], $oldAttendance['attendance_date']);
         
         // Send notification to employee about attendance edit
         if ($oldAttendance['employee_user_id'] && $oldAttendance['employee_user_id'] != $user['user_id']) {
@@ -348,10 +355,15 @@ if ($method === 'DELETE' && preg_match('/\/attendance\/(\d+)/', $uri, $matches))
     $user = AuthMiddleware::checkRole(['admin']);
     $attendanceId = $matches[1];
     
+    $stmt = $db->prepare("SELECT employee_id, attendance_date FROM attendance WHERE attendance_id = ?");
+    $stmt->execute([$attendanceId]);
+    $oldAttendance = $stmt->fetch(PDO::FETCH_ASSOC);
+    
     $stmt = $db->prepare("DELETE FROM attendance WHERE attendance_id = ?");
     $stmt->execute([$attendanceId]);
     
     if ($stmt->rowCount() > 0) {
+        $summaryHelper->refresh($oldAttendance['employee_id'], $oldAttendance['attendance_date']);
         Response::success(null, 'Attendance deleted successfully');
     } else {
         Response::notFound('Attendance not found');
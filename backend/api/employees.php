@@ -19,6 +19,37 @@ $method = $_SERVER['REQUEST_METHOD'];
 $uri = $_SERVER['REQUEST_URI'];
 $data = json_decode(file_get_contents("php://input"), true);
 
+/**
+ * Tell the face recognition service to drop its cached copy of an employee
+ * Best effort: the service cache also expires on its own
+ */
+function invalidateFaceRecognitionCache($employeeId) {
+    $json = json_encode(['employee_id' => (int)$employeeId]);
+    $ch = curl_init('http://localhost:5000/api/employees/cache/invalidate');
+    curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
+    curl_setopt($ch, CURLOPT_TIMEOUT, 2);
+    curl_setopt($ch, CURLOPT_POST, true);
+    curl_setopt($ch, CURLOPT_POSTFIELDS, $json);
+    curl_setopt($ch, CURLOPT_HTTPHEADER, ['Content-Type: application/json']);
+    curl_exec($ch);
+    curl_close($ch);
+}
+
+/**
+ * Remove an employee's face from the recognition index (the photo stays on disk)
+ */
+function removeFaceRecognitionFace($employeeCode) {
+    $json = json_encode(['employee_code' => $employeeCode]);
+    $ch = curl_init('http://localhost:5000/api/remove-photo');
+    curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
+    curl_setopt($ch, CURLOPT_TIMEOUT, 5);
+    curl_setopt($ch, CURLOPT_POST, true);
+    curl_setopt($ch, CURLOPT_POSTFIELDS, $json);
+    curl_setopt($ch, CURLOPT_HTTPHEADER, ['Content-Type: application/json']);
+    curl_exec($ch);
+    curl_close($ch);
+}
+
 // GET all employees
 if ($method === 'GET' && !preg_match('/\/employees\/\d+/', $uri)) {
     $user = AuthMiddleware::authenticate();
@@ -289,7 +320,7 @@ if ($method === 'PUT' && preg_match('/\/employees\/(\d+)/', $uri, $matches)) {
         $db->beginTransaction();
         
         // Get current employee info to check if they have a user_id
-        $stmt = $db->prepare("SELECT user_id, email, department_id, position_id FROM employees WHERE employee_id = ?");
+        $stmt = $db->prepare("SELECT user_id, employee_code, email, department_id, position_id, status FROM employees WHERE employee_id = ?");
         $stmt->execute([$employeeId]);
         $currentEmployee = $stmt->fetch(PDO::FETCH_ASSOC);
         
@@ -419,6 +450,11 @@ if ($method === 'PUT' && preg_match('/\/employees\/(\d+)/', $uri, $matches)) {
         
         // Commit transaction
         $db->commit();
+        invalidateFaceRecognitionCache($employeeId);
+        // A deactivated employee must no longer be recognised and clock in
+        if (($data['status'] ?? 'active') !== 'active' && $currentEmployee['status'] === 'active') {
+            removeFaceRecognitionFace($currentEmployee['employee_code']);
+        }
         
         Response::success(['employee_id' => $employeeId], 'Employee updated successfully');
         
@@ -441,7 +477,7 @@ if ($method === 'DELETE' && preg_match('/\/employees\/(\d+)/', $uri, $matches))
         $db->beginTransaction();
         
         // Get employee info to check user_id
-        $stmt = $db->prepare("SELECT user_id FROM employees WHERE employee_id = ?");
+        $stmt = $db->prepare("SELECT user_id, employee_code FROM employees WHERE employee_id = ?");
         $stmt->execute([$employeeId]);
         $employee = $stmt->fetch(PDO::FETCH_ASSOC);
         
@@ -476,6 +512,8 @@ if ($method === 'DELETE' && preg_match('/\/employees\/(\d+)/', $uri, $matches))
         }
         
         $db->commit();
+        invalidateFaceRecognitionCache($employeeId);
+        removeFaceRecognitionFace($employee['employee_code']);
         Response::success(null, 'Employee deleted successfully');
         
     } catch (PDOException $e) {
@@ -73,6 +73,93 @@ function callPythonAPI($endpoint, $method = 'GET', $data = null, $files = null)
     return $result;
 }
 
+/**
+ * GET a Python API endpoint, revalidating with If-None-Match
+ * Returns ['status' => HTTP code, 'etag' => ETag or null, 'body' => decoded JSON, or null on 304]
+ */
+function callPythonAPIConditional($endpoint, $ifNoneMatch = null) {
+    $etag = null;
+    $ch = curl_init(PYTHON_API_URL . $endpoint);
+    
+    curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
+    curl_setopt($ch, CURLOPT_TIMEOUT, 30);
+    if ($ifNoneMatch) {
+        curl_setopt($ch, CURLOPT_HTTPHEADER, ['If-None-Match: ' . $ifNoneMatch]);
+    }
+    curl_setopt($ch, CURLOPT_HEADERFUNCTION, function ($ch, $header) use (&$etag) {
+        if (stripos($header, 'ETag:') === 0) {
+            $etag = trim(substr($header, 5));
+        }
+        return strlen($header);
+    });
+    
+    $response = curl_exec($ch);
+    $httpCode = curl_getinfo($ch, CURLINFO_HTTP_CODE);
+    $error = curl_error($ch);
+    
+    curl_close($ch);
+    
+    if ($error) {
+        return [
+            'status' => 0,
+            'etag' => null,
+            'body' => [
+                'success' => false,
+                'message' => 'Lỗi kết nối đến dịch vụ nhận diện: ' . $error,
+                'http_code' => 0
+            ]
+        ];
+    }
+    
+    // 304 Not Modified has no body
+    $body = $httpCode === 304 ? null : json_decode($response, true);
+    if (is_array($body)) {
+        $body['http_code'] = $httpCode;
+    }
+    
+    return ['status' => $httpCode, 'etag' => $etag, 'body' => $body];
+}
+
+/**
+ * Stream a Python API GET response (e.g. an export) to the client as it arrives
+ * Forwards the status, Content-Type and Content-Disposition; stops the transfer if the client disconnects
+ */
+function streamPythonAPI($endpoint) {
+    set_time_limit(0);
+    while (ob_get_level() > 0) {
+        ob_end_clean();
+    }
+    
+    $ch = curl_init(PYTHON_API_URL . $endpoint);
+    
+    curl_setopt($ch, CURLOPT_CONNECTTIMEOUT, 10);
+    curl_setopt($ch, CURLOPT_HEADERFUNCTION, function ($ch, $header) {
+        if (preg_match('/^HTTP\/\S+\s+(\d{3})/', $header, $matches)) {
+            http_response_code((int)$matches[1]);
+        } elseif (stripos($header, 'Content-Type:') === 0 || stripos($header, 'Content-Disposition:') === 0) {
+            header(trim($header));
+        }
+        return strlen($header);
+    });
+    curl_setopt($ch, CURLOPT_WRITEFUNCTION, function ($ch, $chunk) {
+        echo $chunk;
+        flush();
+        // A short count aborts the transfer, which also stops the export query on the Python side
+        return connection_aborted() ? 0 : strlen($chunk);
+    });
+    
+    curl_exec($ch);
+    $error = curl_errno($ch) === CURLE_WRITE_ERROR ? null : curl_error($ch);
+    $started = curl_getinfo($ch, CURLINFO_SIZE_DOWNLOAD) > 0;
+    
+    curl_close($ch);
+    
+    if ($error && !$started) {
+        Response::error('Lỗi kết nối đến dịch vụ nhận diện: ' . $error, 502);
+    }
+    exit();
+}
+
 /**
  * Log face recognition activity
  */
@@ -205,6 +292,27 @@ if ($method === 'POST' && strpos($uri, '/face-recognition/verify-photo') !== fal
     Response::json($result);
 }
 
+// POST: Recognize faces in several photos at once (before /recognize, which also matches this path)
+if ($method === 'POST' && strpos($uri, '/face-recognition/recognize-batch') !== false) {
+    $user = AuthMiddleware::checkRole(['admin', 'manager']);
+    
+    if (!isset($_FILES['photos']) || !is_array($_FILES['photos']['tmp_name'])) {
+        Response::error('Không tìm thấy file ảnh', 400);
+    }
+    
+    // PHP cannot repeat a multipart field name, so the photos are forwarded as base64 data URLs
+    $photos = [];
+    foreach ($_FILES['photos']['tmp_name'] as $i => $tmpName) {
+        if ($_FILES['photos']['error'][$i] !== UPLOAD_ERR_OK) {
+            Response::error('Tải ảnh thất bại: ' . $_FILES['photos']['name'][$i], 400);
+        }
+        $photos[] = 'data:' . $_FILES['photos']['type'][$i] . ';base64,' . base64_encode(file_get_contents($tmpName));
+    }
+    
+    $result = callPythonAPI('/recognize/batch', 'POST', ['photos' => $photos]);
+    Response::json($result, $result['http_code'] ?: 502);
+}
+
 // POST: Recognize face
 if ($method === 'POST' && strpos($uri, '/face-recognition/recognize') !== false) {
     $user = AuthMiddleware::authenticate();
@@ -281,8 +389,75 @@ if ($method === 'POST' && strpos($uri, '/face-recognition/attendance-check') !==
 if ($method === 'GET' && strpos($uri, '/face-recognition/employees-with-photos') !== false) {
     $user = AuthMiddleware::checkRole(['admin', 'manager']);
     
-    $result = callPythonAPI('/employees/with-photos');
-    Response::json($result);
+    $ifNoneMatch = $_SERVER['HTTP_IF_NONE_MATCH'] ?? null;
+    $params = array_intersect_key($_GET, array_flip(['after', 'limit', 'fields']));
+    $paged = isset($params['after']) || isset($params['limit']);
+    if (!$paged) {
+        // No paging requested: return the whole list as before, fetched in the largest pages
+        $params['limit'] = 5000;
+    }
+    
+    // The ETag comes from a listing-wide change marker, so the first page's ETag also covers the full list
+    $result = callPythonAPIConditional('/employees/with-photos?' . http_build_query($params), $ifNoneMatch);
+    if ($result['etag']) {
+        header('ETag: ' . $result['etag']);
+    }
+    if ($result['status'] === 304) {
+        http_response_code(304);
+        exit();
+    }
+    
+    $body = $result['body'];
+    if (!is_array($body)) {
+        Response::error('Phản hồi không hợp lệ từ dịch vụ nhận diện', 502);
+    }
+    
+    if (!$paged) {
+        $employees = $body['data'] ?? [];
+        $nextAfter = $body['paging']['next_after'] ?? null;
+        while (!empty($body['success']) && $nextAfter !== null) {
+            $params['after'] = $nextAfter;
+            $body = callPythonAPIConditional('/employees/with-photos?' . http_build_query($params))['body'];
+            if (!is_array($body) || empty($body['success'])) {
+                Response::error('Không thể tải danh sách nhân viên từ dịch vụ nhận diện', 502);
+            }
+            $employees = array_merge($employees, $body['data']);
+            $nextAfter = $body['paging']['next_after'] ?? null;
+        }
+        if (!empty($body['success'])) {
+            $body = ['success' => true, 'data' => $employees, 'http_code' => 200];
+        }
+    }
+    
+    Response::json($body, $result['status'] ?: 200);
+}
+
+// GET: Attendance statistics for many employees (columnar)
+if ($method === 'GET' && strpos($uri, '/face-recognition/attendance-stats') !== false) {
+    $user = AuthMiddleware::checkRole(['admin', 'manager']);
+    
+    $params = array_intersect_key($_GET, array_flip(['from', 'to', 'department_id', 'status']));
+    $result = callPythonAPIConditional('/attendance/stats?' . http_build_query($params), $_SERVER['HTTP_IF_NONE_MATCH'] ?? null);
+    if ($result['etag']) {
+        header('ETag: ' . $result['etag']);
+    }
+    if ($result['status'] === 304) {
+        http_response_code(304);
+        exit();
+    }
+    
+    if (!is_array($result['body'])) {
+        Response::error('Phản hồi không hợp lệ từ dịch vụ nhận diện', 502);
+    }
+    Response::json($result['body'], $result['status'] ?: 502);
+}
+
+// GET: Export raw attendance rows for payroll (CSV or NDJSON, streamed)
+if ($method === 'GET' && strpos($uri, '/face-recognition/attendance-export') !== false) {
+    $user = AuthMiddleware::checkRole(['admin', 'manager']);
+    
+    $params = array_intersect_key($_GET, array_flip(['from', 'to', 'department_id', 'format']));
+    streamPythonAPI('/attendance/export?' . http_build_query($params));
 }
 
 // GET: Get face recognition logs
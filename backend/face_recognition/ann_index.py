@@ -0,0 +1,82 @@
+"""
+IVF (inverted file) approximate nearest-neighbour search on NumPy
+Employee embeddings are partitioned into k-means clusters; a probe is only
+compared against the rows of its nprobe closest clusters. Candidate rows are
+then rescored exactly, so returned distances are the true cosine distances
+and SIMILARITY_THRESHOLD keeps its meaning; nprobe only trades recall for speed
+(EmbeddingIndex rescans the whole gallery when the best candidate is not a clear match).
+"""
+import numpy as np
+from typing import List, Optional
+
+
+class IVFIndex:
+    def __init__(self, nlist: int, nprobe: int, iterations: int = 10, train_sample_per_list: int = 50, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.train_sample_per_list = train_sample_per_list
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self._lists = None
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, embeddings: np.ndarray):
+        """Fit the coarse k-means clusters on a sample, then assign every row"""
+        rng = np.random.default_rng(self.seed)
+        nlist = min(self.nlist, len(embeddings))
+        sample_size = min(len(embeddings), nlist * self.train_sample_per_list)
+        sample = embeddings[rng.choice(len(embeddings), sample_size, replace=False)]
+        sample = np.asarray(sample, dtype=np.float32)
+
+        # Spherical k-means: embeddings are unit vectors, so cluster on cosine similarity
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for k in range(nlist):
+                members = sample[labels == k]
+                if len(members):
+                    centroids[k] = members.sum(axis=0)
+                else:
+                    # Re-seed empty clusters with a random sample point
+                    centroids[k] = sample[rng.integers(len(sample))]
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        self.centroids = centroids
+        self.assignments = self.assign(embeddings)
+        self._lists = None
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Nearest coarse cluster of each vector"""
+        if len(vectors) == 0:
+            return np.zeros(0, dtype=np.int32)
+        return np.argmax(np.atleast_2d(vectors) @ self.centroids.T, axis=1).astype(np.int32)
+
+    def take(self, rows: np.ndarray):
+        """Follow rows being removed or moved in the embedding matrix (new row i was old row rows[i])"""
+        self.assignments = self.assignments[rows]
+        self._lists = None
+
+    def append(self, vectors: np.ndarray):
+        """Assign rows appended to the end of the embedding matrix"""
+        self.assignments = np.concatenate([self.assignments, self.assign(vectors)])
+        self._lists = None
+
+    def _inverted_lists(self) -> List[np.ndarray]:
+        """Row indices per cluster, rebuilt lazily after modifications"""
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind='stable')
+            bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+            self._lists = [order[bounds[k]:bounds[k + 1]] for k in range(len(self.centroids))]
+        return self._lists
+
+    def candidates(self, probes: np.ndarray) -> List[np.ndarray]:
+        """Row indices to rescore for each probe: the members of its nprobe closest clusters"""
+        lists = self._inverted_lists()
+        nprobe = min(self.nprobe, len(self.centroids))
+        closest = np.argpartition(-(probes @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        return [np.concatenate([lists[k] for k in row]) for row in closest]
@@ -1,21 +1,94 @@
 """
 Flask API Server for Face Recognition Attendance System
 """
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, g, Response
 from flask_cors import CORS
 import os
+import time
 import base64
 from pathlib import Path
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import config
 from face_recognition_system import FaceRecognitionSystem
-from database import Database
+from database import DatabaseBusyError
+from maintenance import Janitor
+import metrics
+from attendance_export import EXPORT_FORMATS, export_chunks
 
 app = Flask(__name__)
 CORS(app)
 
 # Initialize system
-face_system = FaceRecognitionSystem()
+# Spawned inference workers re-import this module as __mp_main__; they must not build their own system
+face_system = FaceRecognitionSystem() if __name__ != '__mp_main__' else None
+
+# Periodic housekeeping (temp files, logs, cooldowns, index) on a background thread
+janitor = Janitor(config.MAINTENANCE_INTERVAL_SECONDS, face_system.maintenance_tasks()) if face_system else None
+if janitor:
+    janitor.start()
+
+HTTP_SECONDS = metrics.REGISTRY.histogram("http_request_duration_seconds", "HTTP request latency", "endpoint", "status")
+
+RAW_IMAGE_MIMETYPES = ('application/octet-stream', 'image/jpeg', 'image/png')
+
+def read_raw_image():
+    """
+    Decode a raw binary image request body (no multipart, no base64)
+    Returns: (img, error_message, status_code)
+    """
+    if request.mimetype not in RAW_IMAGE_MIMETYPES:
+        return None, f"Content-Type phải là một trong: {', '.join(RAW_IMAGE_MIMETYPES)}", 415
+    
+    max_bytes = int(config.MAX_PHOTO_SIZE_MB * 1024 * 1024)
+    if request.content_length and request.content_length > max_bytes:
+        return None, f"File quá lớn. Kích thước tối đa: {config.MAX_PHOTO_SIZE_MB}MB", 413
+    
+    # Read the body stream directly into the decoder
+    body = request.stream.read(max_bytes + 1)
+    if len(body) > max_bytes:
+        return None, f"File quá lớn. Kích thước tối đa: {config.MAX_PHOTO_SIZE_MB}MB", 413
+    if not body:
+        return None, "Thiếu dữ liệu ảnh", 400
+    
+    img = face_system.decode_image(body)
+    if img is None:
+        return None, "Không thể đọc file ảnh", 400
+    
+    return img, None, 200
+
+def read_date_range(max_days):
+    """
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD (inclusive, default: the current month) as a half-open range
+    Returns: (start, end, error_message)
+    """
+    try:
+        start = date.fromisoformat(request.args['from']) if request.args.get('from') else date.today().replace(day=1)
+        if request.args.get('to'):
+            end = date.fromisoformat(request.args['to']) + timedelta(days=1)
+        else:
+            end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    except ValueError:
+        return None, None, 'Ngày không hợp lệ, định dạng đúng là YYYY-MM-DD'
+    
+    if end <= start or (end - start).days > max_days:
+        return None, None, f'Khoảng thời gian không hợp lệ (tối đa {max_days} ngày)'
+    
+    return start, end, None
+
+def not_modified(etag):
+    """True if the client's If-None-Match already names this (weak) ETag"""
+    return etag is not None and request.if_none_match.contains_weak(etag)
+
+def conditional_response(etag, payload=None):
+    """
+    JSON response carrying a weak ETag, or an empty 304 when payload is None.
+    Clients must revalidate (no-cache) but can skip the body when nothing changed
+    """
+    response = jsonify(payload) if payload is not None else Response(status=304)
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -26,11 +99,36 @@ def health_check():
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage latencies, outcome counters and queue/index gauges in the Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/inference/stats', methods=['GET'])
+def inference_stats():
+    """Inference backend statistics (worker count, micro-batching histograms)"""
+    return jsonify({
+        'success': True,
+        'data': face_system.inference.stats()
+    })
+
+@app.route('/api/maintenance/stats', methods=['GET'])
+def maintenance_stats():
+    """Background janitor run timings, last task results and attendance photo writer counters"""
+    return jsonify({
+        'success': True,
+        'data': {
+            **janitor.stats(),
+            'photo_writer': face_system.photo_writer.stats()
+        }
+    })
+
 @app.route('/api/upload-photo', methods=['POST'])
 def upload_employee_photo():
     """
     Upload employee photo for face recognition
     Expected: multipart/form-data with 'photo' file and 'employee_code'
+    Optional 'append=true' adds another enrollment photo instead of replacing
     """
     try:
         # Get employee code
@@ -66,15 +164,17 @@ def upload_employee_photo():
                 'message': f'File quá lớn. Kích thước tối đa: {config.MAX_PHOTO_SIZE_MB}MB'
             }), 400
         
-        # Save temporary file
-        temp_path = face_system.save_temp_image(photo)
+        # Decode upload in memory
+        img = face_system.decode_image(photo)
+        if img is None:
+            return jsonify({
+                'success': False,
+                'message': 'Không thể đọc file ảnh'
+            }), 400
         
         # Process and save photo
-        success, message, saved_path = face_system.save_employee_photo(employee_code, temp_path)
-        
-        # Cleanup temp file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        append = request.form.get('append', '').lower() in ('1', 'true')
+        success, message, saved_path = face_system.save_employee_photo(employee_code, img, append)
         
         if success:
             return jsonify({
@@ -98,7 +198,7 @@ def upload_employee_photo():
 def upload_photo_base64():
     """
     Upload employee photo as base64
-    Expected JSON: {'employee_code': 'EMP001', 'photo': 'data:image/jpeg;base64,...'}
+    Expected JSON: {'employee_code': 'EMP001', 'photo': 'data:image/jpeg;base64,...', 'append': false}
     """
     try:
         data = request.get_json()
@@ -112,15 +212,59 @@ def upload_photo_base64():
                 'message': 'Thiếu mã nhân viên hoặc ảnh'
             }), 400
         
-        # Save base64 to temp file
-        temp_path = face_system.save_temp_image(photo_base64)
+        # Decode upload in memory
+        img = face_system.decode_image(photo_base64)
+        if img is None:
+            return jsonify({
+                'success': False,
+                'message': 'Không thể đọc file ảnh'
+            }), 400
         
         # Process and save photo
-        success, message, saved_path = face_system.save_employee_photo(employee_code, temp_path)
+        success, message, saved_path = face_system.save_employee_photo(employee_code, img, bool(data.get('append')))
+        
+        if success:
+            return jsonify({
+                'success': True,
+                'message': message,
+                'photo_path': saved_path
+            })
+        else:
+            return jsonify({
+                'success': False,
+                'message': message
+            }), 400
+            
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Lỗi server: {str(e)}'
+        }), 500
+
+@app.route('/api/upload-photo-raw', methods=['POST'])
+def upload_photo_raw():
+    """
+    Upload employee photo as a raw binary body
+    Expected: Content-Type image/jpeg or application/octet-stream, ?employee_code=EMP001[&append=true]
+    """
+    try:
+        employee_code = request.args.get('employee_code')
+        if not employee_code:
+            return jsonify({
+                'success': False,
+                'message': 'Thiếu mã nhân viên'
+            }), 400
         
-        # Cleanup temp file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        img, error, status = read_raw_image()
+        if img is None:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), status
+        
+        # Process and save photo
+        append = request.args.get('append', '').lower() in ('1', 'true')
+        success, message, saved_path = face_system.save_employee_photo(employee_code, img, append)
         
         if success:
             return jsonify({
@@ -140,6 +284,50 @@ def upload_photo_base64():
             'message': f'Lỗi server: {str(e)}'
         }), 500
 
+@app.route('/api/remove-photo', methods=['POST'])
+def remove_employee_photo():
+    """
+    Remove employee from the recognition index (e.g. when deactivated)
+    Expected JSON: {'employee_code': 'EMP001'}
+    """
+    try:
+        data = request.get_json(silent=True) or request.form
+        employee_code = data.get('employee_code')
+        
+        if not employee_code:
+            return jsonify({
+                'success': False,
+                'message': 'Thiếu mã nhân viên'
+            }), 400
+        
+        success, message = face_system.remove_employee_face(employee_code)
+        
+        if success:
+            return jsonify({
+                'success': True,
+                'message': message
+            })
+        else:
+            return jsonify({
+                'success': False,
+                'message': message
+            }), 404
+            
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Lỗi server: {str(e)}'
+        }), 500
+
+@app.route('/api/index/ingest', methods=['POST'])
+def ingest_enrollments():
+    """Merge pending bulk enrollment batches (written by bulk_enroll.py) into the recognition index"""
+    success, message = face_system.ingest_enrollments()
+    return jsonify({
+        'success': success,
+        'message': message
+    }), 200 if success else 500
+
 @app.route('/api/recognize', methods=['POST'])
 def recognize_face():
     """
@@ -160,22 +348,20 @@ def recognize_face():
                 'message': 'Chưa chọn file'
             }), 400
         
-        # Save temporary file
-        temp_path = face_system.save_temp_image(photo)
+        # Decode upload in memory
+        img = face_system.decode_image(photo)
+        if img is None:
+            return jsonify({
+                'success': False,
+                'message': 'Không thể đọc file ảnh'
+            }), 400
         
         # Find face in database
-        found, employee_code, confidence, message = face_system.find_face_in_database(temp_path)
-        
-        # Cleanup temp file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        found, employee_code, confidence, message = face_system.find_face_in_database(img)
         
         if found:
             # Get employee info
-            db = Database()
-            db.connect()
-            employee = db.get_employee_by_code(employee_code)
-            db.disconnect()
+            employee = face_system.db.get_employee_by_code(employee_code)
             
             return jsonify({
                 'success': True,
@@ -216,22 +402,64 @@ def recognize_face_base64():
                 'message': 'Thiếu dữ liệu ảnh'
             }), 400
         
-        # Save base64 to temp file
-        temp_path = face_system.save_temp_image(photo_base64)
+        # Decode upload in memory
+        img = face_system.decode_image(photo_base64)
+        if img is None:
+            return jsonify({
+                'success': False,
+                'message': 'Không thể đọc file ảnh'
+            }), 400
         
         # Find face in database
-        found, employee_code, confidence, message = face_system.find_face_in_database(temp_path)
+        found, employee_code, confidence, message = face_system.find_face_in_database(img)
         
-        # Cleanup temp file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        if found:
+            # Get employee info
+            employee = face_system.db.get_employee_by_code(employee_code)
+            
+            return jsonify({
+                'success': True,
+                'message': message,
+                'employee': {
+                    'employee_code': employee_code,
+                    'full_name': employee.get('full_name'),
+                    'department': employee.get('department_name'),
+                    'position': employee.get('position_name')
+                },
+                'confidence': float(confidence)
+            })
+        else:
+            return jsonify({
+                'success': False,
+                'message': message
+            }), 404
+            
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Lỗi server: {str(e)}'
+        }), 500
+
+@app.route('/api/recognize-raw', methods=['POST'])
+def recognize_face_raw():
+    """
+    Recognize face from a raw binary image body
+    Expected: Content-Type image/jpeg or application/octet-stream
+    """
+    try:
+        img, error, status = read_raw_image()
+        if img is None:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), status
+        
+        # Find face in database
+        found, employee_code, confidence, message = face_system.find_face_in_database(img)
         
         if found:
             # Get employee info
-            db = Database()
-            db.connect()
-            employee = db.get_employee_by_code(employee_code)
-            db.disconnect()
+            employee = face_system.db.get_employee_by_code(employee_code)
             
             return jsonify({
                 'success': True,
@@ -256,6 +484,74 @@ def recognize_face_base64():
             'message': f'Lỗi server: {str(e)}'
         }), 500
 
+@app.route('/api/recognize/batch', methods=['POST'])
+def recognize_face_batch():
+    """
+    Recognize faces in several images with one batched model pass
+    Expected: multipart/form-data with several 'photos' files,
+    or JSON: {'photos': ['data:image/jpeg;base64,...', ...]}
+    """
+    try:
+        if request.files:
+            photos = request.files.getlist('photos')
+        else:
+            data = request.get_json(silent=True) or {}
+            photos = data.get('photos') or []
+        
+        if not photos:
+            return jsonify({
+                'success': False,
+                'message': 'Thiếu dữ liệu ảnh'
+            }), 400
+        
+        if len(photos) > config.MAX_BATCH_SIZE:
+            return jsonify({
+                'success': False,
+                'message': f'Quá nhiều ảnh. Tối đa {config.MAX_BATCH_SIZE} ảnh mỗi lần'
+            }), 400
+        
+        # Decode uploads in memory; undecodable images are reported per item
+        images = [face_system.decode_image(photo) for photo in photos]
+        valid = [i for i, img in enumerate(images) if img is not None]
+        matches = face_system.recognize_many([images[i] for i in valid])
+        
+        outcomes = [(False, None, None, 'Không thể đọc file ảnh')] * len(images)
+        for i, match in zip(valid, matches):
+            outcomes[i] = match
+        
+        # Get employee info (one pooled connection for the whole request)
+        results = []
+        for found, employee_code, confidence, message in outcomes:
+            if not found:
+                results.append({
+                    'success': False,
+                    'message': message
+                })
+                continue
+            employee = face_system.db.get_employee_by_code(employee_code) or {}
+            results.append({
+                'success': True,
+                'message': message,
+                'employee': {
+                    'employee_code': employee_code,
+                    'full_name': employee.get('full_name'),
+                    'department': employee.get('department_name'),
+                    'position': employee.get('position_name')
+                },
+                'confidence': float(confidence)
+            })
+        
+        return jsonify({
+            'success': True,
+            'results': results
+        })
+            
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Lỗi server: {str(e)}'
+        }), 500
+
 @app.route('/api/attendance/check', methods=['POST'])
 def check_attendance():
     """
@@ -279,15 +575,16 @@ def check_attendance():
         # Get expected employee code from request (for validation)
         expected_employee_code = request.form.get('employee_code')
         
-        # Save temporary file
-        temp_path = face_system.save_temp_image(photo)
+        # Decode upload in memory
+        img = face_system.decode_image(photo)
+        if img is None:
+            return jsonify({
+                'success': False,
+                'message': 'Không thể đọc file ảnh'
+            }), 400
         
         # Process attendance with expected employee code
-        result = face_system.process_attendance(temp_path, expected_employee_code)
-        
-        # Cleanup temp file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        result = face_system.process_attendance(img, expected_employee_code)
         
         if result['success']:
             return jsonify(result)
@@ -316,15 +613,47 @@ def check_attendance_base64():
                 'message': 'Thiếu dữ liệu ảnh'
             }), 400
         
-        # Save base64 to temp file
-        temp_path = face_system.save_temp_image(photo_base64)
+        # Decode upload in memory
+        img = face_system.decode_image(photo_base64)
+        if img is None:
+            return jsonify({
+                'success': False,
+                'message': 'Không thể đọc file ảnh'
+            }), 400
         
         # Process attendance
-        result = face_system.process_attendance(temp_path)
+        result = face_system.process_attendance(img)
+        
+        if result['success']:
+            return jsonify(result)
+        else:
+            return jsonify(result), 400
+            
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Lỗi server: {str(e)}'
+        }), 500
+
+@app.route('/api/attendance/check-raw', methods=['POST'])
+def check_attendance_raw():
+    """
+    Process attendance check-in/out from a raw binary image body
+    Expected: Content-Type image/jpeg or application/octet-stream, optional ?employee_code=EMP001
+    """
+    try:
+        img, error, status = read_raw_image()
+        if img is None:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), status
+        
+        # Get expected employee code from request (for validation)
+        expected_employee_code = request.args.get('employee_code')
         
-        # Cleanup temp file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        # Process attendance with expected employee code
+        result = face_system.process_attendance(img, expected_employee_code)
         
         if result['success']:
             return jsonify(result)
@@ -363,6 +692,83 @@ def get_attendance_stats(employee_code):
             'message': f'Lỗi server: {str(e)}'
         }), 500
 
+@app.route('/api/attendance/stats', methods=['GET'])
+def get_bulk_attendance_stats():
+    """
+    Attendance statistics for many employees in one call, as columns (one list per field)
+    Query: ?from=2025-11-01&to=2025-11-30 (inclusive, default: current month),
+           optional ?department_id=1 and ?status=present,late
+    Honours If-None-Match: unchanged statistics are answered with 304 Not Modified
+    """
+    try:
+        start, end, error = read_date_range(config.STATS_MAX_RANGE_DAYS)
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), 400
+        
+        department_id = request.args.get('department_id', type=int)
+        statuses = [status for status in request.args.get('status', '').split(',') if status]
+        invalid = [status for status in statuses if status not in face_system.db.ATTENDANCE_STATUSES]
+        if invalid:
+            return jsonify({
+                'success': False,
+                'message': f"Trạng thái không hợp lệ: {', '.join(invalid)}"
+            }), 400
+        
+        etag = face_system.attendance_stats_etag(start, end, department_id, statuses)
+        if not_modified(etag):
+            return conditional_response(etag)
+        
+        return conditional_response(etag, {
+            'success': True,
+            'data': face_system.get_bulk_attendance_stats(start, end, department_id, statuses)
+        })
+            
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Lỗi server: {str(e)}'
+        }), 500
+
+@app.route('/api/attendance/export', methods=['GET'])
+def export_attendance():
+    """
+    Raw attendance rows for payroll, streamed as they are read from the database
+    Query: ?from=2025-11-01&to=2025-11-30 (inclusive, default: current month),
+           optional ?department_id=1 and ?format=csv|ndjson (default csv)
+    Sent with chunked transfer encoding; memory use does not grow with the row count
+    """
+    try:
+        start, end, error = read_date_range(config.EXPORT_MAX_RANGE_DAYS)
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), 400
+        
+        fmt = request.args.get('format', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({
+                'success': False,
+                'message': f"Định dạng phải là một trong: {', '.join(EXPORT_FORMATS)}"
+            }), 400
+        
+        department_id = request.args.get('department_id', type=int)
+        rows = face_system.db.stream_attendance(start, end, department_id)
+        chunks = export_chunks(rows, fmt, face_system.db.ATTENDANCE_EXPORT_COLUMNS, config.DATABASE_STREAM_BATCH_SIZE)
+        filename = f"attendance_{start.isoformat()}_{(end - timedelta(days=1)).isoformat()}.{fmt}"
+        return Response(chunks, mimetype=EXPORT_FORMATS[fmt], headers={
+            'Content-Disposition': f'attachment; filename="{filename}"'
+        })
+            
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Lỗi server: {str(e)}'
+        }), 500
+
 @app.route('/api/verify-photo', methods=['POST'])
 def verify_photo():
     """
@@ -383,15 +789,16 @@ def verify_photo():
                 'message': 'Chưa chọn file'
             }), 400
         
-        # Save temporary file
-        temp_path = face_system.save_temp_image(photo)
+        # Decode upload in memory
+        img = face_system.decode_image(photo)
+        if img is None:
+            return jsonify({
+                'success': False,
+                'message': 'Không thể đọc file ảnh'
+            }), 400
         
         # Verify face
-        is_valid, message = face_system.verify_face_in_image(temp_path)
-        
-        # Cleanup temp file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        is_valid, message = face_system.verify_face_in_image(img)
         
         return jsonify({
             'success': is_valid,
@@ -406,16 +813,41 @@ def verify_photo():
 
 @app.route('/api/employees/with-photos', methods=['GET'])
 def get_employees_with_photos():
-    """Get list of employees who have uploaded photos"""
+    """
+    Get active employees who have uploaded photos, one page at a time (keyset on employee_id)
+    Query: ?after=<paging.next_after of the previous page>&limit=500&fields=employee_code,full_name
+    Honours If-None-Match: an unchanged page is answered with 304 Not Modified
+    """
     try:
-        db = Database()
-        db.connect()
-        employees = db.get_all_active_employees_with_photos()
-        db.disconnect()
+        after_id = request.args.get('after', 0, type=int)
+        limit = request.args.get('limit', config.EMPLOYEES_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, config.EMPLOYEES_MAX_PAGE_SIZE))
         
-        return jsonify({
+        fields = [field for field in request.args.get('fields', '').split(',') if field]
+        invalid = [field for field in fields if field not in face_system.db.EMPLOYEE_PHOTO_FIELDS]
+        if invalid:
+            return jsonify({
+                'success': False,
+                'message': f"Trường không hợp lệ: {', '.join(invalid)}"
+            }), 400
+        fields = fields or list(face_system.db.EMPLOYEE_PHOTO_DEFAULT_FIELDS)
+        
+        etag = face_system.employees_with_photos_etag(after_id, limit, fields)
+        if not_modified(etag):
+            return conditional_response(etag)
+        
+        # One extra row tells whether another page follows
+        employees = face_system.db.get_employees_with_photos_page(after_id, limit + 1, fields)
+        has_more = len(employees) > limit
+        employees = employees[:limit]
+        
+        return conditional_response(etag, {
             'success': True,
-            'data': employees
+            'data': employees,
+            'paging': {
+                'limit': limit,
+                'next_after': employees[-1]['employee_id'] if has_more else None
+            }
         })
             
     except Exception as e:
@@ -424,11 +856,72 @@ def get_employees_with_photos():
             'message': f'Lỗi server: {str(e)}'
         }), 500
 
-# Cleanup temp files periodically
+@app.route('/api/employees/cache/invalidate', methods=['POST'])
+def invalidate_employee_cache():
+    """
+    Drop cached employee metadata after an employee changed (status, department...)
+    Expected JSON: {employee_code} or {employee_id}; an empty body clears the whole cache
+    """
+    data = request.get_json(silent=True) or {}
+    employee_code = data.get('employee_code')
+    employee_id = data.get('employee_id')
+    
+    if employee_code is None and employee_id is None:
+        face_system.db.employees.clear()
+    else:
+        face_system.db.invalidate_employee(employee_code, employee_id)
+    
+    return jsonify({
+        'success': True,
+        'data': face_system.db.employees.stats()
+    })
+
+# Per-request stage timings for /api/metrics and the optional Server-Timing header
+@app.before_request
+def begin_request_timing():
+    g.request_started = time.perf_counter()
+    metrics.begin_request()
+
+@app.after_request
+def record_request_timing(response):
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_SECONDS.labels(endpoint, response.status_code).observe(elapsed)
+    if config.SERVER_TIMING_ENABLED:
+        timings = dict(metrics.request_timings(), total=elapsed * 1000.0)
+        response.headers['Server-Timing'] = metrics.server_timing_header(timings)
+    return response
+
+# One pooled database connection per request, checked out on first use
 @app.before_request
-def cleanup():
-    """Cleanup old temp files before each request"""
-    face_system.cleanup_temp_files()
+def begin_db_request():
+    face_system.db.begin_request()
+
+def database_busy_response():
+    response = jsonify({
+        'success': False,
+        'message': 'Cơ sở dữ liệu đang quá tải, vui lòng thử lại sau'
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(config.DATABASE_POOL_TIMEOUT)
+    return response
+
+@app.errorhandler(DatabaseBusyError)
+def database_busy(e):
+    return database_busy_response()
+
+@app.after_request
+def answer_busy_database(response):
+    # Handlers and FaceRecognitionSystem catch broad exceptions; a request that could not get a
+    # pooled connection must still be answered 503, not as "not found" or a generic 500
+    if face_system.db.pool_exhausted() and response.status_code != 503:
+        return database_busy_response()
+    return response
+
+@app.teardown_request
+def end_db_request(exc):
+    face_system.db.end_request()
+
 
 if __name__ == '__main__':
     print("=" * 60)
@@ -0,0 +1,65 @@
+"""
+Attendance export serialisation
+Turns a row iterator (Database.stream_attendance) into text chunks for a
+streamed HTTP response, so an export of any size is never held in memory:
+- csv: header row, then one line per attendance row (UTF-8 with BOM for Excel)
+- ndjson: one JSON object per line
+"""
+import csv
+import io
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, Sequence
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def export_value(value):
+    """A database value as plain JSON/CSV data (TIME columns come back as timedelta)"""
+    if isinstance(value, timedelta):
+        seconds = int(value.total_seconds())
+        return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def csv_chunks(rows: Iterable[Dict], columns: Sequence[str], rows_per_chunk: int) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')  # BOM, so Excel reads Vietnamese names as UTF-8
+    writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        writer.writerow([export_value(row[name]) for name in columns])
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(rows: Iterable[Dict], columns: Sequence[str], rows_per_chunk: int) -> Iterator[str]:
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({name: export_value(row[name]) for name in columns}, ensure_ascii=False))
+        if len(lines) >= rows_per_chunk:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def export_chunks(rows: Iterable[Dict], fmt: str, columns: Sequence[str], rows_per_chunk: int) -> Iterator[str]:
+    """Serialise rows as `fmt` (a key of EXPORT_FORMATS), rows_per_chunk rows per yielded chunk"""
+    if fmt == 'csv':
+        return csv_chunks(rows, columns, rows_per_chunk)
+    return ndjson_chunks(rows, columns, rows_per_chunk)
@@ -0,0 +1,87 @@
+"""
+Backfill / rebuild attendance_monthly_summary from the attendance table
+The service keeps the summary up to date as employees check in and out, and
+the PHP attendance API refreshes the affected employee-month on every edit;
+run this once after upgrading an existing database, or after bulk SQL edits:
+
+    python attendance_summary.py                 # every month that has attendance
+    python attendance_summary.py --month 2025-11 # one month
+"""
+import argparse
+import sys
+from database import Database
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS attendance_monthly_summary (
+        employee_id int(11) NOT NULL,
+        year smallint(6) NOT NULL,
+        month tinyint(4) NOT NULL,
+        total_days int(11) NOT NULL DEFAULT 0,
+        present_days int(11) NOT NULL DEFAULT 0,
+        late_days int(11) NOT NULL DEFAULT 0,
+        absent_days int(11) NOT NULL DEFAULT 0,
+        total_hours decimal(8,2) NOT NULL DEFAULT 0.00,
+        total_overtime decimal(8,2) NOT NULL DEFAULT 0.00,
+        updated_at timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+        PRIMARY KEY (employee_id, year, month),
+        KEY idx_year_month_updated (year, month, updated_at),
+        CONSTRAINT attendance_monthly_summary_ibfk_1 FOREIGN KEY (employee_id)
+            REFERENCES employees (employee_id) ON DELETE CASCADE
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+MARKER_INDEX = "idx_year_month_updated"  # serves the stats change marker (COUNT/MAX(updated_at) per month range)
+
+
+def ensure_marker_index(db: Database):
+    """Add the marker index to a summary table created before it existed"""
+    exists = db.fetch_one("""
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = 'attendance_monthly_summary' AND index_name = %s
+        LIMIT 1
+    """, (MARKER_INDEX,))
+    if not exists:
+        db.execute_query(f"ALTER TABLE attendance_monthly_summary ADD KEY {MARKER_INDEX} (year, month, updated_at)")
+
+
+def months_with_attendance(db: Database):
+    """(year, month) pairs from the first to the last attendance date"""
+    bounds = db.fetch_one("SELECT MIN(attendance_date) AS first, MAX(attendance_date) AS last FROM attendance")
+    if not bounds or not bounds['first']:
+        return []
+    months = []
+    year, month = bounds['first'].year, bounds['first'].month
+    while (year, month) <= (bounds['last'].year, bounds['last'].month):
+        months.append((year, month))
+        year, month = year + month // 12, month % 12 + 1
+    return months
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild attendance_monthly_summary from attendance")
+    parser.add_argument('--month', help="Only this month, as YYYY-MM")
+    args = parser.parse_args()
+
+    db = Database()
+    if not db.connect():
+        sys.exit("Không thể kết nối đến cơ sở dữ liệu")
+    db.execute_query(CREATE_TABLE)
+    ensure_marker_index(db)
+
+    if args.month:
+        year, month = (int(part) for part in args.month.split('-'))
+        months = [(year, month)]
+    else:
+        months = months_with_attendance(db)
+
+    failed = 0
+    for year, month in months:
+        ok = db.refresh_monthly_summary(year, month)
+        failed += not ok
+        print(f"{year}-{month:02d}: {'OK' if ok else 'LỖI'}")
+    print(f"Đã tổng hợp {len(months) - failed}/{len(months)} tháng")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""
+Stand-ins used by the benchmarks so they run on a CPU-only box without
+network access, model weights or a MySQL server
+- install_fake_deepface(): importable deepface stub (the model is never called)
+- SyntheticFaces: gallery embeddings and probe images that encode who they show
+- FakeInference: same interface as inference.LocalInference, embeds a probe by
+  reading the identity back from its pixels (optionally sleeping to mimic the model)
+- SQLiteDatabase: the subset of database.Database used by the service, on SQLite
+"""
+import sqlite3
+import sys
+import threading
+import time
+import types
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import config
+from employee_cache import EmployeeCache
+
+UNKNOWN = 0xFFFFFFFF  # identity marker for probes of people who are not enrolled
+
+
+def install_fake_deepface():
+    """Make `from deepface import DeepFace` importable when deepface/tensorflow are not installed"""
+    try:
+        import deepface  # noqa: F401
+        return
+    except ImportError:
+        pass
+    deepface = types.ModuleType("deepface")
+    modules = types.ModuleType("deepface.modules")
+    preprocessing = types.ModuleType("deepface.modules.preprocessing")
+
+    def unavailable(*args, **kwargs):
+        raise RuntimeError("deepface stub: the benchmarks use FakeInference instead")
+
+    deepface.DeepFace = types.SimpleNamespace(build_model=unavailable, extract_faces=unavailable)
+    preprocessing.resize_image = unavailable
+    preprocessing.normalize_input = unavailable
+    modules.preprocessing = preprocessing
+    deepface.modules = modules
+    sys.modules.update({
+        "deepface": deepface,
+        "deepface.modules": modules,
+        "deepface.modules.preprocessing": preprocessing,
+    })
+
+
+class SyntheticFaces:
+    """A random gallery of unit embeddings, one per employee, and probe images of those employees"""
+
+    def __init__(self, size: int, dim: int = 512, noise: float = 0.05, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        gallery = self.rng.standard_normal((size, dim)).astype(np.float32)
+        self.gallery = gallery / np.linalg.norm(gallery, axis=1, keepdims=True)
+        self.codes = [f"BENCH{i:06d}" for i in range(size)]
+        self.noise = noise
+
+    def probe_image(self, employee: Optional[int], height: int = 240, width: int = 320) -> np.ndarray:
+        """A BGR frame whose first pixels carry the employee index (None = unknown person)"""
+        img = self.rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        marker = UNKNOWN if employee is None else employee
+        img[0, :4, 0] = np.frombuffer(np.uint32(marker).tobytes(), dtype=np.uint8)
+        return img
+
+    def embed(self, img: np.ndarray) -> np.ndarray:
+        """Embedding of the person shown in a probe image: their gallery row plus noise"""
+        marker = int(np.frombuffer(img[0, :4, 0].tobytes(), dtype=np.uint32)[0])
+        rng = np.random.default_rng(marker)
+        if marker == UNKNOWN or marker >= len(self.gallery):
+            return rng.standard_normal(self.gallery.shape[1]).astype(np.float32)
+        return self.gallery[marker] + self.noise * rng.standard_normal(self.gallery.shape[1]).astype(np.float32)
+
+
+class FakeInference:
+    """Drop-in for LocalInference; model_ms simulates detection + embedding time per image"""
+
+    def __init__(self, faces: SyntheticFaces, model_ms: float = 0.0):
+        self.faces = faces
+        self.model_seconds = model_ms / 1000.0
+
+    def _model(self, images: int = 1):
+        if self.model_seconds:
+            time.sleep(self.model_seconds * images)
+
+    def verify(self, img: np.ndarray) -> Tuple[bool, str]:
+        self._model()
+        return True, "Ảnh hợp lệ"
+
+    def detect_and_embed(self, img: np.ndarray, enforce_detection: bool = True) -> Tuple[bool, str, Optional[np.ndarray]]:
+        self._model()
+        return True, "Ảnh hợp lệ", self.faces.embed(img)
+
+    def detect_and_embed_many(self, images: List[np.ndarray]) -> List[Tuple[bool, str, Optional[np.ndarray]]]:
+        self._model(len(images))
+        return [(True, "Ảnh hợp lệ", self.faces.embed(img)) for img in images]
+
+    def queue_depth(self) -> int:
+        return 0
+
+    def stats(self) -> Dict:
+        return {'backend': 'fake', 'workers': 0, 'model_ms': self.model_seconds * 1000.0}
+
+
+class SQLiteDatabase:
+    """
+    In-memory SQLite stand-in for database.Database
+    Keeps the same method names and return shapes, including the conditional
+    check-in/check-out upsert, so the write path does comparable work
+    """
+
+    def __init__(self, employee_codes: List[str]):
+        self._connection = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.employees = EmployeeCache(config.EMPLOYEE_CACHE_SIZE or config.EMPLOYEE_CACHE_MIN_SIZE,
+                                       config.EMPLOYEE_CACHE_TTL_SECONDS)
+        self._connection.executescript("""
+            CREATE TABLE employees (
+                employee_id INTEGER PRIMARY KEY, employee_code TEXT UNIQUE, full_name TEXT,
+                department_name TEXT, position_name TEXT, status TEXT, face_photo TEXT
+            );
+            CREATE TABLE attendance (
+                attendance_id INTEGER PRIMARY KEY AUTOINCREMENT, employee_id INTEGER, shift_id INTEGER,
+                attendance_date TEXT, check_in TEXT, check_out TEXT, actual_hours REAL, overtime_hours REAL,
+                late_minutes INTEGER, status TEXT, check_in_photo TEXT, check_out_photo TEXT,
+                check_in_method TEXT, check_out_method TEXT,
+                UNIQUE (employee_id, attendance_date, shift_id)
+            );
+        """)
+        self._connection.executemany(
+            "INSERT INTO employees VALUES (?, ?, ?, 'Benchmark', 'Nhân viên', 'active', ?)",
+            [(i + 1, code, f"Nhân viên {code}", f"{code}/{code}.jpg") for i, code in enumerate(employee_codes)]
+        )
+
+    def _query(self, query: str, params=()) -> List[Dict]:
+        with self._lock:
+            return [dict(row) for row in self._connection.execute(query, params).fetchall()]
+
+    def connect(self):
+        return self._connection
+
+    def disconnect(self):
+        pass
+
+    def begin_request(self):
+        pass
+
+    def end_request(self):
+        pass
+
+    def pool_exhausted(self):
+        return False
+
+    def fetch_one(self, query, params=None):
+        rows = self._query(query, params or ())
+        return rows[0] if rows else None
+
+    def fetch_all(self, query, params=None):
+        return self._query(query, params or ())
+
+    def get_employee_by_code(self, employee_code):
+        employee = self.employees.get_by_code(employee_code)
+        if employee is None:
+            employee = self.fetch_one(
+                "SELECT * FROM employees WHERE employee_code = ? AND status = 'active'", (employee_code,)
+            )
+            if employee:
+                self.employees.put(employee)
+        return employee
+
+    def get_employee_by_id(self, employee_id):
+        employee = self.employees.get_by_id(employee_id)
+        if employee is None:
+            employee = self.fetch_one("SELECT * FROM employees WHERE employee_id = ? AND status = 'active'", (employee_id,))
+            if employee:
+                self.employees.put(employee)
+        return employee
+
+    def size_employee_cache(self):
+        headcount = self.fetch_one("SELECT COUNT(*) AS headcount FROM employees WHERE status = 'active'")['headcount']
+        if config.EMPLOYEE_CACHE_SIZE is None:
+            self.employees.resize(max(config.EMPLOYEE_CACHE_MIN_SIZE, headcount + headcount // 10))
+        return headcount
+
+    def warm_employee_cache(self, headcount):
+        if headcount is None or headcount > self.employees.max_size:
+            return 0
+        return self.employees.put_many(self.fetch_all("SELECT * FROM employees WHERE status = 'active'"))
+
+    def invalidate_employee(self, employee_code=None, employee_id=None):
+        self.employees.invalidate(employee_code, employee_id)
+
+    def update_employee_face_photo(self, employee_id, photo_path):
+        self._query("UPDATE employees SET face_photo = ? WHERE employee_id = ?", (photo_path, employee_id))
+        self.invalidate_employee(employee_id=employee_id)
+
+    def get_employees_with_photos_page(self, after_id=0, limit=500, fields=None):
+        return self.fetch_all(
+            "SELECT employee_id, employee_code, full_name, face_photo FROM employees"
+            " WHERE status = 'active' AND face_photo IS NOT NULL AND face_photo != '' AND employee_id > ?"
+            " ORDER BY employee_id LIMIT ?", (after_id, limit)
+        )
+
+    def get_monthly_summary(self, employee_id, year, month):
+        start = f"{year:04d}-{month:02d}-01"
+        end = f"{year + month // 12:04d}-{month % 12 + 1:02d}-01"
+        return self.fetch_one("""
+            SELECT COUNT(*) AS total_days, SUM(status = 'present') AS present_days, SUM(status = 'late') AS late_days,
+                SUM(status = 'absent') AS absent_days, SUM(actual_hours) AS total_hours, SUM(overtime_hours) AS total_overtime
+            FROM attendance WHERE employee_id = ? AND attendance_date >= ? AND attendance_date < ?
+        """, (employee_id, start, end))
+
+    def refresh_monthly_summary(self, year, month, employee_id=None):
+        # get_monthly_summary aggregates on read here, there is nothing to refresh
+        return True
+
+    def clear_attendance_photo(self, attendance_id, column, photo_path):
+        self._query(f"UPDATE attendance SET {column} = NULL WHERE attendance_id = ? AND {column} = ?",
+                    (attendance_id, photo_path))
+
+    def record_attendance(self, employee_id, check_in_photo=None, check_out_photo=None, now=None, shift_id=1):
+        """Same decision as Database.record_attendance, as one SQLite upsert plus a read back"""
+        now = (now or datetime.now()).replace(microsecond=0)
+        today = now.date().isoformat()
+        current_time = now.time().isoformat()
+        # SQLite evaluates every SET expression against the old row, so order does not matter here
+        can_check_out = (
+            "attendance.check_out IS NULL AND attendance.check_in IS NOT NULL"
+            " AND strftime('%s', excluded.check_in) - strftime('%s', attendance.check_in)"
+            f" >= {int(config.COOLDOWN_SECONDS)}"
+        )
+        worked_hours = "(strftime('%s', excluded.check_in) - strftime('%s', attendance.check_in)) / 3600.0"
+        query = f"""
+            INSERT INTO attendance
+            (employee_id, shift_id, attendance_date, check_in, late_minutes, status, check_in_photo, check_in_method)
+            VALUES (?, ?, ?, ?, 0, 'present', ?, 'face_recognition')
+            ON CONFLICT (employee_id, attendance_date, shift_id) DO UPDATE SET
+                actual_hours = CASE WHEN {can_check_out} THEN ROUND({worked_hours}, 2) ELSE actual_hours END,
+                overtime_hours = CASE WHEN {can_check_out} THEN ROUND(MAX(0, {worked_hours} - 8), 2) ELSE overtime_hours END,
+                check_out_photo = CASE WHEN {can_check_out} THEN ? ELSE check_out_photo END,
+                check_out_method = CASE WHEN {can_check_out} THEN 'face_recognition' ELSE check_out_method END,
+                check_out = CASE WHEN {can_check_out} THEN excluded.check_in ELSE check_out END
+        """
+        with self._lock:
+            self._connection.execute(query, (employee_id, shift_id, today, current_time, check_in_photo, check_out_photo))
+            row = self._connection.execute(
+                "SELECT * FROM attendance WHERE employee_id = ? AND attendance_date = ? AND shift_id = ?",
+                (employee_id, today, shift_id)
+            ).fetchone()
+        attendance = dict(row)
+        if attendance['check_out'] == current_time:
+            return 'check_out', attendance
+        if attendance['check_out'] is not None:
+            return 'complete', attendance
+        if attendance['check_in'] == current_time:
+            return 'check_in', attendance
+        return 'cooldown', attendance
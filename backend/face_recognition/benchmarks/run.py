@@ -0,0 +1,265 @@
+"""
+Benchmarks for the recognition and attendance hot paths
+Synthetic galleries (100 to 100k employees) and probe images, a stubbed
+model (benchmarks/fakes.py) and an in-memory SQLite stand-in for MySQL, so
+the suite runs on a CPU-only box without network, weights or a database.
+
+Measured per gallery size, with `--concurrency` client threads:
+- search: TemplateIndex.search (exact and IVF)
+- find_face_in_database
+- process_attendance
+- Flask /api/recognize-raw and /api/attendance/check-raw (in-process test client)
+
+Usage (from backend/face_recognition):
+    python benchmarks/run.py --sizes 100,1000,10000,100000 --output results.json
+    python benchmarks/run.py --compare baseline.json --output results.json
+
+Results are written as JSON (throughput, mean/p50/p95/p99 latency in ms).
+With --compare, p95 latencies are checked against a previous run and the
+exit status is 1 if any regressed by more than --tolerance. The exit status
+is also 1 if the search recall@1 (exact or IVF) is below --min-recall.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config  # noqa: E402
+from fakes import SyntheticFaces, FakeInference, SQLiteDatabase, install_fake_deepface  # noqa: E402
+
+
+def measure(call: Callable[[int], object], requests: int, concurrency: int) -> Dict:
+    """Run call(i) for i in range(requests) on `concurrency` threads and summarise the latencies"""
+    def timed(i):
+        started = time.perf_counter()
+        call(i)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        latencies = [timed(i) for i in range(requests)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(timed, range(requests)))
+    wall = time.perf_counter() - started
+
+    latencies_ms = np.asarray(latencies) * 1000.0
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'throughput_per_s': round(requests / wall, 2),
+        'mean_ms': round(float(latencies_ms.mean()), 4),
+        'p50_ms': round(float(p50), 4),
+        'p95_ms': round(float(p95), 4),
+        'p99_ms': round(float(p99), 4),
+    }
+
+
+def use_temp_dirs(root: Path):
+    """Point every path the service writes to at a scratch directory"""
+    config.EMPLOYEE_PHOTOS_DIR = root / "employee_photos"
+    config.ATTENDANCE_PHOTOS_DIR = root / "attendance_photos"
+    config.TEMP_DIR = root / "temp"
+    config.LOGS_DIR = root / "logs"
+    config.INDEX_DIR = root / "index"
+    config.EMBEDDING_INDEX_PATH = config.INDEX_DIR / "embeddings.bin"
+    config.TEMPLATE_MEDOIDS_PATH = config.INDEX_DIR / "medoids.bin"
+    config.TEMPLATE_SAMPLES_PATH = config.INDEX_DIR / "samples.bin"
+    config.ENROLLMENT_INBOX_DIR = config.INDEX_DIR / "inbox"
+    config.COOLDOWN_STORE_PATH = root / "cooldowns.db"
+    for directory in (config.EMPLOYEE_PHOTOS_DIR, config.ATTENDANCE_PHOTOS_DIR, config.TEMP_DIR,
+                      config.LOGS_DIR, config.INDEX_DIR, config.ENROLLMENT_INBOX_DIR):
+        directory.mkdir(parents=True, exist_ok=True)
+
+
+def bench_search(faces: SyntheticFaces, mode: str, args) -> Dict:
+    from template_index import TemplateIndex
+
+    config.INDEX_MODE = mode
+    index = TemplateIndex()
+    index.rebuild(faces.gallery, faces.codes)
+    probes = [faces.embed(faces.probe_image(i % len(faces.codes))) for i in range(args.requests)]
+    result = measure(lambda i: index.search(probes[i], top_k=1), args.requests, args.concurrency)
+    hits = sum(index.search(probes[i], top_k=1)[0][0] == faces.codes[i % len(faces.codes)] for i in range(min(200, args.requests)))
+    result['recall_at_1'] = round(hits / min(200, args.requests), 4)
+    return result
+
+
+def build_system(faces: SyntheticFaces, root: Path, args):
+    """A FaceRecognitionSystem on the synthetic gallery, fake model and SQLite stand-in"""
+    from template_index import TemplateIndex
+    import face_recognition_system
+
+    use_temp_dirs(root)
+    config.INDEX_MODE = args.index_mode
+    index = TemplateIndex()
+    index.rebuild(faces.gallery, faces.codes)
+    index.save()
+
+    face_recognition_system.Database = lambda: SQLiteDatabase(faces.codes)
+    face_recognition_system.create_inference = lambda: FakeInference(faces, args.model_ms)
+    return face_recognition_system.FaceRecognitionSystem()
+
+
+def probe_set(faces: SyntheticFaces, count: int, unknown_ratio: float) -> List[np.ndarray]:
+    """Probe frames cycling through employees, with a share of unknown people"""
+    unknown_every = int(1 / unknown_ratio) if unknown_ratio > 0 else 0
+    return [
+        faces.probe_image(None if unknown_every and i % unknown_every == 0 else i % len(faces.codes))
+        for i in range(count)
+    ]
+
+
+def bench_system(system, faces: SyntheticFaces, args) -> Dict[str, Dict]:
+    probes = probe_set(faces, args.requests, args.unknown_ratio)
+    results = {'find_face_in_database': measure(
+        lambda i: system.find_face_in_database(probes[i]), args.requests, args.concurrency
+    )}
+
+    actions = {}
+    actions_lock = threading.Lock()
+
+    def attend(i):
+        outcome = system.process_attendance(probes[i])
+        key = outcome['action'] or ('error' if outcome['recognized_employee'] else 'rejected')
+        with actions_lock:
+            actions[key] = actions.get(key, 0) + 1
+
+    results['process_attendance'] = measure(attend, args.requests, args.concurrency)
+    results['process_attendance']['outcomes'] = actions
+    system.photo_writer.flush()
+    return results
+
+
+def bench_flask(system, faces: SyntheticFaces, args) -> Dict[str, Dict]:
+    import cv2
+    import app as app_module
+
+    app_module.face_system = system
+    client = app_module.app.test_client()
+    # PNG keeps the identity pixels intact (JPEG would not)
+    bodies = [cv2.imencode('.png', img)[1].tobytes() for img in probe_set(faces, args.requests, args.unknown_ratio)]
+
+    results = {}
+    for endpoint in ('/api/recognize-raw', '/api/attendance/check-raw'):
+        def post(i, endpoint=endpoint):
+            response = client.post(endpoint, data=bodies[i], content_type='image/png')
+            if response.status_code >= 500:
+                raise RuntimeError(f"{endpoint} returned {response.status_code}")
+        results[endpoint] = measure(post, args.requests, args.concurrency)
+    system.photo_writer.flush()
+    return results
+
+
+def compare(results: List[Dict], baseline_path: str, tolerance: float) -> bool:
+    """Print p95 changes against a previous run. Returns True if nothing regressed beyond tolerance"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['benchmark'], r['gallery_size'], r['concurrency']): r for r in json.load(f)['results']}
+    ok = True
+    for result in results:
+        before = baseline.get((result['benchmark'], result['gallery_size'], result['concurrency']))
+        if not before:
+            continue
+        change = result['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+        regressed = change > tolerance
+        ok = ok and not regressed
+        print(f"{'REGRESSION' if regressed else 'ok':>10}  {result['benchmark']:<32} n={result['gallery_size']:<7} "
+              f"p95 {before['p95_ms']:.3f} -> {result['p95_ms']:.3f} ms ({change * 100:+.1f}%)")
+    return ok
+
+
+def check_recall(results: List[Dict], min_recall: float) -> bool:
+    """Print the search recall@1 per mode and size. Returns True if none is below min_recall"""
+    ok = True
+    for result in results:
+        if 'recall_at_1' not in result:
+            continue
+        low = result['recall_at_1'] < min_recall
+        ok = ok and not low
+        print(f"{'LOW RECALL' if low else 'ok':>10}  {result['benchmark']:<32} n={result['gallery_size']:<7} "
+              f"recall@1 {result['recall_at_1']:.4f} (min {min_recall:.4f})")
+    return ok
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the face recognition hot paths")
+    parser.add_argument('--sizes', default="100,1000,10000,100000", help="Gallery sizes (employees), comma separated")
+    parser.add_argument('--requests', type=int, default=500, help="Calls per benchmark")
+    parser.add_argument('--concurrency', type=int, default=8, help="Client threads")
+    parser.add_argument('--model-ms', type=float, default=0.0, help="Simulated detection + embedding time per image")
+    parser.add_argument('--index-mode', default=config.INDEX_MODE, choices=['exact', 'ivf'], help="Index mode of the service benchmarks")
+    parser.add_argument('--unknown-ratio', type=float, default=0.1, help="Share of probes showing people who are not enrolled")
+    parser.add_argument('--only', default="search,system,flask", help="Benchmark groups to run")
+    parser.add_argument('--output', default="benchmark_results.json", help="JSON results file")
+    parser.add_argument('--compare', help="Previous results file to check for p95 regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed p95 increase before --compare fails (0.2 = 20%%)")
+    parser.add_argument('--min-recall', type=float, default=0.99, help="Lowest accepted search recall@1 (exact and IVF)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    groups = set(args.only.split(','))
+    install_fake_deepface()
+    config.COOLDOWN_SECONDS = 0  # every probe goes through the full write path
+    config.COOLDOWN_BACKEND = "memory"
+
+    results = []
+
+    def record(benchmark: str, size: int, result: Dict):
+        result.update(benchmark=benchmark, gallery_size=size)
+        results.append(result)
+        print(f"{benchmark:<36} n={size:<7} {result['throughput_per_s']:>10.1f}/s  "
+              f"p50 {result['p50_ms']:.3f}  p95 {result['p95_ms']:.3f}  p99 {result['p99_ms']:.3f} ms")
+
+    for size in [int(s) for s in args.sizes.split(',')]:
+        faces = SyntheticFaces(size)
+        if 'search' in groups:
+            for mode in ('exact', 'ivf'):
+                record(f"search[{mode}]", size, bench_search(faces, mode, args))
+        if groups & {'system', 'flask'}:
+            with tempfile.TemporaryDirectory(prefix="face_bench_") as root:
+                system = build_system(faces, Path(root), args)
+                if 'system' in groups:
+                    for name, result in bench_system(system, faces, args).items():
+                        record(name, size, result)
+                if 'flask' in groups:
+                    for name, result in bench_flask(system, faces, args).items():
+                        record(f"flask {name}", size, result)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {args.output}")
+
+    recall_ok = check_recall(results, args.min_recall)
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+    if not recall_ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""
+Bulk enrollment of employee face photos (e.g. when onboarding a new site)
+Instead of one /api/upload-photo call per employee, photos are decoded,
+detected, embedded, resized and written by a pool of worker processes (one
+model per worker). The face_photo updates are sent in batches, and the new
+embeddings are handed to the running service as one batch file in
+ENROLLMENT_INBOX_DIR, which it merges into its index with a single rebuild
+(on /api/index/ingest, or at its next start). The service stays the only
+writer of the index files it has memory-mapped.
+
+    python bulk_enroll.py --dir photos/            # photos/EMP001.jpg or photos/EMP001/*.jpg
+    python bulk_enroll.py --csv photos.csv         # employee_code,image_path per line
+    python bulk_enroll.py --csv photos.csv --append --workers 8 --report failures.csv
+
+Images that cannot be enrolled (unknown employee, unreadable file, no face)
+are listed with the reason in the failure report; the exit status is 1 if
+there were any.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+import config
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+PHOTO_MAX_WIDTH = 800  # same size and quality as save_employee_photo
+PHOTO_QUALITY = 95
+
+# Worker-process side: one pipeline (and model) per worker, built by the initializer
+_worker_pipeline = None
+_worker_strict = False
+
+
+def _init_worker(strict: bool):
+    global _worker_pipeline, _worker_strict
+    from face_pipeline import FacePipeline  # only workers load deepface/TensorFlow
+    _worker_pipeline = FacePipeline()
+    _worker_strict = strict
+
+
+def _prepare_photo(job: Tuple[str, str, str]) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """
+    Worker: decode, resize, write and embed one photo
+    job is (employee_code, source image, target path). Returns: (embedding, error)
+    """
+    _, source, target = job
+    try:
+        img = cv2.imread(source)
+        if img is None:
+            return None, "Không thể đọc file ảnh"
+
+        height, width = img.shape[:2]
+        if width > PHOTO_MAX_WIDTH:
+            img = cv2.resize(img, (PHOTO_MAX_WIDTH, int(height * PHOTO_MAX_WIDTH / width)))
+
+        # Uploads accept any image (no enforced detection); --strict requires a face that passes the checks
+        success, message, embedding = _worker_pipeline.process(img, enforce_detection=_worker_strict)
+        if not success or embedding is None:
+            return None, message
+
+        if not cv2.imwrite(target, img, [cv2.IMWRITE_JPEG_QUALITY, PHOTO_QUALITY]):
+            return None, "Không thể ghi ảnh"
+        return embedding, None
+    except Exception as e:
+        return None, f"Lỗi xử lý ảnh: {str(e)}"
+
+
+def read_jobs(args) -> List[Tuple[str, str]]:
+    """(employee_code, image path) pairs from --dir or --csv"""
+    if args.dir:
+        root = Path(args.dir)
+        pairs = []
+        for path in sorted(root.rglob("*")):
+            if path.suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            # photos/EMP001.jpg, or several photos in photos/EMP001/
+            code = path.stem if path.parent == root else path.parent.name
+            pairs.append((code, str(path)))
+        return pairs
+
+    base = Path(args.csv).resolve().parent
+    pairs = []
+    with open(args.csv, newline='', encoding='utf-8-sig') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip() or row[0].strip() == 'employee_code':
+                continue
+            image_path = Path(row[1].strip())
+            pairs.append((row[0].strip(), str(image_path if image_path.is_absolute() else base / image_path)))
+    return pairs
+
+
+def plan_targets(pairs: List[Tuple[str, str]], append: bool) -> List[Tuple[str, str, str]]:
+    """Where each photo is written: EMP001/EMP001.jpg when replacing, timestamped names otherwise"""
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    seen = {}
+    jobs = []
+    for code, source in pairs:
+        n = seen[code] = seen.get(code, 0) + 1
+        filename = f"{code}.jpg" if n == 1 and not append else f"{code}_{stamp}_{n:03d}.jpg"
+        employee_dir = config.EMPLOYEE_PHOTOS_DIR / code
+        employee_dir.mkdir(exist_ok=True)
+        jobs.append((code, source, str(employee_dir / filename)))
+    return jobs
+
+
+def prune_photos(code: str, written: List[str], append: bool):
+    """Drop photos replaced by this run, or beyond MAX_ENROLLMENT_PHOTOS (oldest first) when appending"""
+    employee_dir = config.EMPLOYEE_PHOTOS_DIR / code
+    keep = {Path(path).name for path in written}
+    photos = sorted(employee_dir.glob("*.jpg"), key=lambda p: p.stat().st_mtime)
+    if append:
+        stale = photos[:max(0, len(photos) - config.MAX_ENROLLMENT_PHOTOS)]
+    else:
+        stale = [photo for photo in photos if photo.name not in keep]
+    for photo in stale:
+        try:
+            photo.unlink()
+        except OSError:
+            pass
+
+
+def queue_for_index(enrolled: Dict[str, List[np.ndarray]], append: bool) -> Path:
+    """Write the new embeddings as an enrollment batch for the service to merge"""
+    from template_index import write_enrollment_batch
+
+    codes = [code for code, embeddings in enrolled.items() for _ in embeddings]
+    embeddings = np.vstack([np.vstack(new) for new in enrolled.values()])
+    path = config.ENROLLMENT_INBOX_DIR / f"enroll_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.npz"
+    write_enrollment_batch(path, embeddings, codes, append)
+    return path
+
+
+def notify_service(url: str):
+    """Ask the running API server to merge the pending enrollment batches"""
+    try:
+        request = urllib.request.Request(url, data=b'', method='POST')
+        with urllib.request.urlopen(request, timeout=30) as response:
+            print(json.loads(response.read().decode('utf-8')).get('message'))
+    except Exception as e:
+        print(f"Không thể báo dịch vụ ({e}); lô đăng ký sẽ được nạp khi gọi POST {url} hoặc khi dịch vụ khởi động lại")
+
+
+def write_report(path: str, failures: List[Tuple[str, str, str]]):
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['employee_code', 'image_path', 'error'])
+        writer.writerows(failures)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Enroll many employee face photos at once")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--dir', help="Directory of <employee_code>.jpg files or <employee_code>/ subdirectories")
+    source.add_argument('--csv', help="CSV file of employee_code,image_path (paths relative to the CSV)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes (one model each)")
+    parser.add_argument('--append', action='store_true', help="Add photos to existing enrollments instead of replacing them")
+    parser.add_argument('--strict', action='store_true', help="Reject photos without a face passing the quality checks")
+    parser.add_argument('--report', default="enrollment_failures.csv", help="Per-image failure report (CSV)")
+    parser.add_argument('--notify', default=f"http://127.0.0.1:{config.FLASK_PORT}/api/index/ingest",
+                        help="Enrollment ingest URL of the running service")
+    parser.add_argument('--no-notify', action='store_true', help="Leave the batch for the service to merge at its next start")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    started = time.perf_counter()
+    from database import Database
+
+    db = Database()
+    if not db.connect():
+        sys.exit("Không thể kết nối đến cơ sở dữ liệu")
+
+    pairs = read_jobs(args)
+    employee_ids = db.get_employee_ids_by_codes({code for code, _ in pairs})
+    failures = [(code, source, "Không tìm thấy nhân viên") for code, source in pairs if code not in employee_ids]
+    pairs = [(code, source) for code, source in pairs if code in employee_ids]
+    jobs = plan_targets(pairs, args.append)
+    print(f"{len(jobs)} ảnh của {len({code for code, _ in pairs})} nhân viên, {args.workers} tiến trình")
+
+    enrolled, written = {}, {}
+    # spawn, not fork: every worker loads its own model
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(args.strict,)) as executor:
+        chunksize = max(1, min(32, len(jobs) // (args.workers * 4)))
+        results = executor.map(_prepare_photo, jobs, chunksize=chunksize)
+        for done, ((code, source, target), (embedding, error)) in enumerate(zip(jobs, results), 1):
+            if error:
+                failures.append((code, source, error))
+            else:
+                enrolled.setdefault(code, []).append(embedding)
+                written.setdefault(code, []).append(target)
+            if done % 500 == 0:
+                print(f"  {done}/{len(jobs)} ảnh ({time.perf_counter() - started:.0f}s)")
+
+    for code, targets in written.items():
+        prune_photos(code, targets, args.append)
+    photos = [
+        (employee_ids[code], Path(targets[-1]).relative_to(config.EMPLOYEE_PHOTOS_DIR).as_posix())
+        for code, targets in written.items()
+    ]
+    updated = db.update_employee_face_photos(photos)
+    batch_path = queue_for_index(enrolled, args.append) if enrolled else None
+
+    write_report(args.report, failures)
+    print(f"Đã đăng ký {sum(len(v) for v in enrolled.values())} ảnh của {len(enrolled)} nhân viên "
+          f"({updated} bản ghi cập nhật) trong {time.perf_counter() - started:.0f}s")
+    if batch_path is not None:
+        print(f"Lô đăng ký: {batch_path}")
+    print(f"{len(failures)} ảnh lỗi, xem {args.report}")
+
+    if batch_path is not None and not args.no_notify:
+        notify_service(args.notify)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,33 +12,86 @@ DATABASE_HOST = "localhost:3307"
 DATABASE_NAME = "hrm_system"
 DATABASE_USER = "root"
 DATABASE_PASSWORD = ""
+DATABASE_POOL_SIZE = 10  # Pooled connections shared by all request threads (max 32)
+DATABASE_POOL_TIMEOUT = 10  # Seconds to wait for a free pooled connection
+DATABASE_HEALTHCHECK_IDLE_SECONDS = 60  # Ping a pooled connection before reuse if idle longer than this
+DATABASE_RECONNECT_ATTEMPTS = 3  # Reconnect attempts when a pooled connection was dropped
+DATABASE_STREAM_BATCH_SIZE = 1000  # Rows per fetchmany() when streaming large result sets (exports)
+DATABASE_STREAM_WRITE_TIMEOUT = 600  # net_write_timeout for streaming queries, so slow HTTP clients do not abort them
+EMPLOYEE_CACHE_SIZE = None  # Employees kept in the in-process metadata cache (LRU); None: active headcount + 10% at startup
+EMPLOYEE_CACHE_MIN_SIZE = 1000  # Smallest automatically sized cache (also its size until the headcount is read)
+EMPLOYEE_CACHE_TTL_SECONDS = 600  # Re-read an employee's name/department/position after this long
+EMPLOYEE_CACHE_WARMUP = True  # Load all active employees into the cache at startup (skipped if they do not fit)
 
 # Paths
 EMPLOYEE_PHOTOS_DIR = BASE_DIR / "employee_photos"
+ATTENDANCE_PHOTOS_DIR = BASE_DIR / "attendance_photos"
 TEMP_DIR = BASE_DIR / "temp"
 LOGS_DIR = BASE_DIR / "logs"
+INDEX_DIR = BASE_DIR / "index"
+EMBEDDING_INDEX_PATH = INDEX_DIR / "embeddings.bin"  # one mean template per employee
+TEMPLATE_MEDOIDS_PATH = INDEX_DIR / "medoids.bin"
+TEMPLATE_SAMPLES_PATH = INDEX_DIR / "samples.bin"  # one embedding per enrollment photo
+ENROLLMENT_INBOX_DIR = INDEX_DIR / "inbox"  # Bulk enrollment batches waiting to be merged into the index by the service
+COOLDOWN_STORE_PATH = BASE_DIR / "cooldowns.db"  # shared by worker processes when COOLDOWN_BACKEND = "sqlite"
 
 # Create directories if they don't exist
 EMPLOYEE_PHOTOS_DIR.mkdir(exist_ok=True)
+ATTENDANCE_PHOTOS_DIR.mkdir(exist_ok=True)
 TEMP_DIR.mkdir(exist_ok=True)
 LOGS_DIR.mkdir(exist_ok=True)
+INDEX_DIR.mkdir(exist_ok=True)
+ENROLLMENT_INBOX_DIR.mkdir(exist_ok=True)
 
 # Face Recognition settings
 FACE_RECOGNITION_MODEL = "Facenet512"  # Options: VGG-Face, Facenet, Facenet512, ArcFace
 DETECTOR_BACKEND = "opencv"  # Options: opencv, ssd, dlib, mtcnn, retinaface
-DISTANCE_METRIC = "cosine"  # Options: cosine, euclidean, euclidean_l2
+DISTANCE_METRIC = "cosine"  # Options: cosine, euclidean_l2 (embeddings are L2-normalised; plain euclidean is rejected)
 SIMILARITY_THRESHOLD = 0.4  # Lower is stricter (0.0 - 1.0)
+EMBEDDING_NORMALIZATION = "base"  # Input normalization used by the embedding model
+EMBEDDING_STORE_DTYPE = "float32"  # float32 is memory-mapped as is; float16 halves the file but is upcast on load
+INFERENCE_WORKERS = 0  # Worker processes for detection/embedding; 0 runs them in the web process
+MICRO_BATCHING_ENABLED = True  # Merge concurrent single-image requests into one forward pass (in-process backend only)
+MICRO_BATCH_WINDOW_MS = 10  # How long to wait for more requests before running a batch
+MICRO_BATCH_MAX_SIZE = 16  # Run the batch as soon as this many requests are waiting
+MAX_ENROLLMENT_PHOTOS = 10  # Photos kept per employee; the oldest are dropped beyond this
+TEMPLATE_MEDOIDS = 3  # Medoid embeddings kept per employee alongside the mean
+TEMPLATE_RESCORE_K = 5  # Best employees (by mean) rescored against their medoids
+INDEX_MODE = "exact"  # "exact" brute-force scan, or "ivf" approximate search for very large galleries
+IVF_MIN_SIZE = 20000  # Below this many embeddings the exact scan is used even in "ivf" mode
+IVF_NLIST = 0  # Number of k-means clusters; 0 = sqrt(gallery size)
+IVF_NPROBE = 32  # Clusters scanned per probe; higher = better recall, slower search
+IVF_EXACT_MARGIN = 0.05  # Probes whose best IVF distance is above SIMILARITY_THRESHOLD minus this are rescanned exactly
+IVF_TRAIN_ITERATIONS = 10  # k-means iterations when (re)training the clusters
+LEGACY_REPRESENTATIONS_FILE = "ds_model_facenet512_detector_opencv_aligned_normalization_base_expand_0.pkl"  # DeepFace.find cache, read once to seed the index
 
 # Attendance settings
 COOLDOWN_SECONDS = 30  # Prevent duplicate check-ins within this time
+COOLDOWN_BACKEND = "memory"  # "memory" (this process only) or "sqlite" (shared by all processes on the host)
+COOLDOWN_MAX_ENTRIES = 10000  # Employees remembered at once; the oldest cooldowns are dropped beyond this
 PHOTO_QUALITY_MIN_WIDTH = 200
 PHOTO_QUALITY_MIN_HEIGHT = 200
+PHOTO_WRITER_WORKERS = 2  # Background threads encoding and writing attendance photos
+PHOTO_WRITER_MAX_PENDING = 256  # Photos waiting to be written; further photos are dropped (and counted)
 MAX_PHOTO_SIZE_MB = 5
+MAX_BATCH_SIZE = 32  # Max images per /api/recognize/batch request
+STATS_MAX_RANGE_DAYS = 366  # Longest date range accepted by /api/attendance/stats
+EXPORT_MAX_RANGE_DAYS = 366  # Longest date range accepted by /api/attendance/export
+EMPLOYEES_PAGE_SIZE = 500  # Default page size of /api/employees/with-photos
+EMPLOYEES_MAX_PAGE_SIZE = 5000  # Largest page a client may ask for
+
+# Maintenance settings (background janitor thread)
+MAINTENANCE_INTERVAL_SECONDS = 300  # How often temp files, logs, cooldowns and the index are tidied
+TEMP_FILE_MAX_AGE_HOURS = 24  # Temp files older than this are deleted
+LOG_MAX_BYTES = 10 * 1024 * 1024  # *.log files in LOGS_DIR larger than this are rotated
+LOG_RETENTION_DAYS = 14  # Rotated log files older than this are deleted
+INDEX_RETRAIN_MIN_CHANGES = 100  # Refit IVF clusters only after this many enrollments/removals
 
 # Flask settings
 FLASK_HOST = "0.0.0.0"
 FLASK_PORT = 5000
 FLASK_DEBUG = True
+SERVER_TIMING_ENABLED = False  # Add a Server-Timing header with per-stage durations to every response
 
 # Shift settings (Vietnam timezone UTC+7)
 DEFAULT_SHIFT_START = "08:00:00"
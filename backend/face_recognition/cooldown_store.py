@@ -0,0 +1,120 @@
+"""
+Cooldown stores: remember who was just recognised so the same person is not
+processed again within COOLDOWN_SECONDS
+Entries expire on their own and the number kept is bounded. The in-memory
+store is private to one process; the SQLite store shares cooldowns between
+all worker processes on the host through a WAL-mode database file.
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+import config
+
+
+class MemoryCooldownStore:
+    """Cooldowns of the current process only"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._expiry = OrderedDict()  # key -> time.monotonic() when the cooldown ends, oldest first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._expiry)
+
+    def remaining(self, key: str) -> float:
+        """Seconds left in key's cooldown, 0 if it has none"""
+        with self._lock:
+            expires_at = self._expiry.get(key)
+            if expires_at is None:
+                return 0.0
+            left = expires_at - time.monotonic()
+            if left <= 0:
+                del self._expiry[key]
+                return 0.0
+            return left
+
+    def touch(self, key: str):
+        """Start (or restart) key's cooldown"""
+        with self._lock:
+            self._expiry.pop(key, None)
+            self._expiry[key] = time.monotonic() + self.ttl
+            # Every entry has the same TTL, so the oldest entry expires first
+            while len(self._expiry) > self.max_entries:
+                self._expiry.popitem(last=False)
+
+    def prune(self) -> int:
+        """Drop expired entries. Returns the number removed"""
+        now = time.monotonic()
+        removed = 0
+        with self._lock:
+            while self._expiry:
+                key, expires_at = next(iter(self._expiry.items()))
+                if expires_at > now:
+                    break
+                del self._expiry[key]
+                removed += 1
+        return removed
+
+
+class SQLiteCooldownStore:
+    """Cooldowns shared by every process using the same database file"""
+
+    def __init__(self, path: Path, ttl_seconds: float, max_entries: int):
+        self.path = str(path)
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._local = threading.local()  # sqlite3 connections are per thread
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS cooldowns (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_cooldowns_expires ON cooldowns (expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Autocommit; WAL lets readers in other processes proceed during a write
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM cooldowns").fetchone()[0]
+
+    def remaining(self, key: str) -> float:
+        row = self._connection().execute(
+            "SELECT expires_at FROM cooldowns WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return 0.0
+        return max(0.0, row[0] - time.time())
+
+    def touch(self, key: str):
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cooldowns (key, expires_at) VALUES (?, ?)",
+            (key, time.time() + self.ttl)
+        )
+        # Enforce the bound by dropping the entries that expire first
+        connection.execute(
+            "DELETE FROM cooldowns WHERE key IN ("
+            " SELECT key FROM cooldowns ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def prune(self) -> int:
+        cursor = self._connection().execute("DELETE FROM cooldowns WHERE expires_at <= ?", (time.time(),))
+        return cursor.rowcount
+
+
+def create_cooldown_store():
+    """Pick the cooldown store configured in config.COOLDOWN_BACKEND"""
+    if config.COOLDOWN_BACKEND == "sqlite":
+        return SQLiteCooldownStore(config.COOLDOWN_STORE_PATH, config.COOLDOWN_SECONDS, config.COOLDOWN_MAX_ENTRIES)
+    return MemoryCooldownStore(config.COOLDOWN_SECONDS, config.COOLDOWN_MAX_ENTRIES)
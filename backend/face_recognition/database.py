@@ -1,99 +1,338 @@
 """
 Database connection and utilities
 """
+import threading
+import time
+from contextlib import contextmanager
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, errors, pooling
+from mysql.connector.constants import ClientFlag
 from datetime import datetime, date, timedelta
 import config
+from employee_cache import EmployeeCache
+from metrics import observe_stage, stage
+
+# Errors that mean the connection itself was lost (server restart, wait_timeout, network)
+CONNECTION_LOST_ERRORS = (errors.OperationalError, errors.InterfaceError)
+
+
+class DatabaseBusyError(Exception):
+    """
+    No pooled connection became free within DATABASE_POOL_TIMEOUT
+    Deliberately not a mysql.connector Error: the query helpers must not turn it into
+    an empty result (an employee "not found"); the API answers 503 instead
+    """
 
 class Database:
+    """
+    Pool-backed database access, safe to share between Flask threads
+    Every query checks a connection out of a process-wide pool and returns it;
+    inside request_scope() the first query pins one connection to the current
+    thread until the scope ends
+    """
+    _pool = None
+    _pool_slots = None
+    _pool_lock = threading.Lock()
+    _last_used = {}  # id of underlying connection -> time.monotonic() of its last release
+    
     def __init__(self):
-        self.connection = None
-        
+        self._local = threading.local()
+        self.employees = EmployeeCache(config.EMPLOYEE_CACHE_SIZE or config.EMPLOYEE_CACHE_MIN_SIZE,
+                                       config.EMPLOYEE_CACHE_TTL_SECONDS)
+    
+    @classmethod
+    def _get_pool(cls):
+        """Create the shared connection pool on first use"""
+        with cls._pool_lock:
+            if cls._pool is None:
+                cls._pool = pooling.MySQLConnectionPool(
+                    pool_name="face_recognition",
+                    pool_size=config.DATABASE_POOL_SIZE,
+                    pool_reset_session=False,
+                    autocommit=True,
+                    # ROW_COUNT() counts changed rows, not matched ones (record_attendance relies on it)
+                    client_flags=[-ClientFlag.FOUND_ROWS],
+                    host=config.DATABASE_HOST.split(':')[0],
+                    port=int(config.DATABASE_HOST.split(':')[1]) if ':' in config.DATABASE_HOST else 3306,
+                    database=config.DATABASE_NAME,
+                    user=config.DATABASE_USER,
+                    password=config.DATABASE_PASSWORD
+                )
+                # mysql.connector raises instead of waiting when the pool is empty
+                cls._pool_slots = threading.BoundedSemaphore(config.DATABASE_POOL_SIZE)
+            return cls._pool
+    
     def connect(self):
-        """Establish database connection"""
+        """Create the connection pool and check that the database is reachable"""
         try:
-            self.connection = mysql.connector.connect(
-                host=config.DATABASE_HOST.split(':')[0],
-                port=int(config.DATABASE_HOST.split(':')[1]) if ':' in config.DATABASE_HOST else 3306,
-                database=config.DATABASE_NAME,
-                user=config.DATABASE_USER,
-                password=config.DATABASE_PASSWORD
-            )
-            return self.connection
+            pool = self._get_pool()
+            connection = self._acquire()
+            self._release(connection)
+            return pool
         except Error as e:
             print(f"Database connection error: {e}")
             return None
     
     def disconnect(self):
-        """Close database connection"""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
+        """Return a connection pinned by request_scope() to the pool"""
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            self._release(connection)
+    
+    def _acquire(self):
+        """Check a healthy connection out of the pool, waiting for a free one"""
+        pool = self._get_pool()
+        if not self._pool_slots.acquire(timeout=config.DATABASE_POOL_TIMEOUT):
+            self._local.busy = True
+            raise DatabaseBusyError("Hết kết nối trong pool cơ sở dữ liệu")
+        try:
+            try:
+                connection = pool.get_connection()
+            except errors.PoolError as e:
+                self._local.busy = True
+                raise DatabaseBusyError(str(e)) from e
+            # Health check connections that sat idle long enough to have been dropped by the server
+            last_used = self._last_used.get(self._connection_key(connection), 0)
+            if time.monotonic() - last_used > config.DATABASE_HEALTHCHECK_IDLE_SECONDS:
+                connection.ping(reconnect=True, attempts=config.DATABASE_RECONNECT_ATTEMPTS, delay=1)
+            return connection
+        except Exception:
+            self._pool_slots.release()
+            raise
+    
+    @staticmethod
+    def _connection_key(connection):
+        # PooledMySQLConnection wraps a new proxy around the same underlying connection each time
+        return id(getattr(connection, '_cnx', connection))
+    
+    def _release(self, connection):
+        try:
+            self._last_used[self._connection_key(connection)] = time.monotonic()
+            connection.close()  # returns it to the pool
+        finally:
+            self._pool_slots.release()
+    
+    def begin_request(self):
+        """From now on, the first query pins one pooled connection to this thread"""
+        self._local.scoped = True
+        self._local.busy = False
+    
+    def pool_exhausted(self):
+        """Whether a query since begin_request() found no free pooled connection"""
+        return getattr(self._local, 'busy', False)
+    
+    def end_request(self):
+        """Return the connection pinned since begin_request() to the pool"""
+        self._local.scoped = False
+        self.disconnect()
+    
+    @contextmanager
+    def request_scope(self):
+        """Pin at most one pooled connection to this thread for the duration (e.g. one HTTP request)"""
+        self.begin_request()
+        try:
+            yield self
+        finally:
+            self.end_request()
+    
+    @contextmanager
+    def _checkout(self):
+        pinned = getattr(self._local, 'connection', None)
+        if pinned is not None:
+            yield pinned
+            return
+        connection = self._acquire()
+        if getattr(self._local, 'scoped', False):
+            self._local.connection = connection
+            yield connection
+            return
+        try:
+            yield connection
+        finally:
+            self._release(connection)
+    
+    def _run(self, operation, retry=True):
+        """
+        Run operation(connection) on a checked-out connection, reconnecting once if it was lost
+        With retry=False the connection is reconnected but the error is raised: a write that is
+        not idempotent may have been applied before its acknowledgement was lost
+        """
+        with stage("db"), self._checkout() as connection:
+            try:
+                return operation(connection)
+            except CONNECTION_LOST_ERRORS:
+                connection.reconnect(attempts=config.DATABASE_RECONNECT_ATTEMPTS, delay=1)
+                if not retry:
+                    raise
+                return operation(connection)
     
     def execute_query(self, query, params=None):
         """Execute a query (INSERT, UPDATE, DELETE)"""
-        if not self.connection or not self.connection.is_connected():
-            print("Database connection is not established")
-            return None
+        def run(connection):
+            cursor = connection.cursor()
+            try:
+                cursor.execute(query, params or ())
+                connection.commit()
+                return cursor.lastrowid
+            except CONNECTION_LOST_ERRORS:
+                raise
+            except Error:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query, params or ())
-            self.connection.commit()
-            return cursor.lastrowid
+            return self._run(run)
         except Error as e:
             print(f"Query execution error: {e}")
-            self.connection.rollback()
             return None
     
     def fetch_one(self, query, params=None):
         """Fetch single record"""
-        if not self.connection or not self.connection.is_connected():
-            print("Database connection is not established")
-            return None
+        def run(connection):
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute(query, params or ())
+                return cursor.fetchone()
+            finally:
+                cursor.close()
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute(query, params or ())
-            result = cursor.fetchone()
-            return result
+            return self._run(run)
         except Error as e:
             print(f"Fetch error: {e}")
             return None
     
     def fetch_all(self, query, params=None):
         """Fetch multiple records"""
-        if not self.connection or not self.connection.is_connected():
-            print("Database connection is not established")
-            return []
+        def run(connection):
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute(query, params or ())
+                return cursor.fetchall()
+            finally:
+                cursor.close()
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute(query, params or ())
-            results = cursor.fetchall()
-            return results
+            return self._run(run)
         except Error as e:
             print(f"Fetch error: {e}")
             return []
     
-    def get_employee_by_code(self, employee_code):
-        """Get employee information by code"""
-        query = """
-            SELECT e.*, d.department_name, p.position_name
-            FROM employees e
-            LEFT JOIN departments d ON e.department_id = d.department_id
-            LEFT JOIN positions p ON e.position_id = p.position_id
-            WHERE e.employee_code = %s AND e.status = 'active'
+    def stream(self, query, params=None, batch_size=None):
+        """
+        Yield the rows of a large result set one at a time without materialising it.
+        Uses an unbuffered cursor on a dedicated pooled connection (never the one pinned
+        to the request, which may be returned before a streamed response finishes) and
+        reads batch_size rows per round trip. The connection is held until the generator
+        is exhausted or closed; one closed early is disconnected rather than drained
         """
-        return self.fetch_one(query, (employee_code,))
+        batch_size = batch_size or config.DATABASE_STREAM_BATCH_SIZE
+        try:
+            with stage("db"):
+                connection = self._acquire()
+        except Error as e:
+            print(f"Fetch error: {e}")
+            raise
+        cursor = None
+        timeout_set = False
+        try:
+            cursor = connection.cursor(dictionary=True, buffered=False)
+            # The server gives up on a result the client stops reading for net_write_timeout seconds.
+            # The pool does not reset sessions, so the previous value is kept and put back afterwards
+            cursor.execute(
+                "SET @stream_saved_write_timeout = @@SESSION.net_write_timeout, SESSION net_write_timeout = %s",
+                (config.DATABASE_STREAM_WRITE_TIMEOUT,)
+            )
+            timeout_set = True
+            with stage("db"):
+                cursor.execute(query, params or ())
+            while True:
+                started = time.perf_counter()
+                rows = cursor.fetchmany(batch_size)
+                observe_stage("db", time.perf_counter() - started)
+                if not rows:
+                    break
+                yield from rows
+        except Error as e:
+            print(f"Fetch error: {e}")
+            raise
+        finally:
+            try:
+                if connection.unread_result:
+                    # A consumer that stopped early leaves the rest of the result on the wire.
+                    # Draining it would read the whole export; drop the socket instead (the
+                    # server aborts the query) and the pool reconnects it with a fresh session
+                    getattr(connection, '_cnx', connection).disconnect()
+                else:
+                    if cursor is not None:
+                        cursor.close()
+                    if timeout_set:
+                        cursor = connection.cursor()
+                        cursor.execute("SET SESSION net_write_timeout = @stream_saved_write_timeout")
+                        cursor.close()
+            except Error:
+                # Do not hand a session with the export timeout to the next pooled user
+                try:
+                    getattr(connection, '_cnx', connection).disconnect()
+                except Error:
+                    pass
+            try:
+                self._release(connection)
+            except Error:
+                pass
+    
+    EMPLOYEE_QUERY = """
+        SELECT e.*, d.department_name, p.position_name
+        FROM employees e
+        LEFT JOIN departments d ON e.department_id = d.department_id
+        LEFT JOIN positions p ON e.position_id = p.position_id
+        WHERE e.status = 'active'
+    """
+    
+    def get_employee_by_code(self, employee_code):
+        """Get employee information by code (served from the employee cache when possible)"""
+        employee = self.employees.get_by_code(employee_code)
+        if employee is None:
+            employee = self.fetch_one(self.EMPLOYEE_QUERY + " AND e.employee_code = %s", (employee_code,))
+            if employee:
+                self.employees.put(employee)
+        return employee
     
     def get_employee_by_id(self, employee_id):
-        """Get employee information by ID"""
-        query = """
-            SELECT e.*, d.department_name, p.position_name
-            FROM employees e
-            LEFT JOIN departments d ON e.department_id = d.department_id
-            LEFT JOIN positions p ON e.position_id = p.position_id
-            WHERE e.employee_id = %s AND e.status = 'active'
+        """Get employee information by ID (served from the employee cache when possible)"""
+        employee = self.employees.get_by_id(employee_id)
+        if employee is None:
+            employee = self.fetch_one(self.EMPLOYEE_QUERY + " AND e.employee_id = %s", (employee_id,))
+            if employee:
+                self.employees.put(employee)
+        return employee
+    
+    def size_employee_cache(self):
+        """
+        Size the employee cache to the active headcount plus 10% when EMPLOYEE_CACHE_SIZE is None
+        Returns: the active headcount, or None if it could not be read
         """
-        return self.fetch_one(query, (employee_id,))
+        row = self.fetch_one("SELECT COUNT(*) AS headcount FROM employees WHERE status = 'active'")
+        if not row:
+            return None
+        headcount = int(row['headcount'])
+        if config.EMPLOYEE_CACHE_SIZE is None:
+            self.employees.resize(max(config.EMPLOYEE_CACHE_MIN_SIZE, headcount + headcount // 10))
+        return headcount
+    
+    def warm_employee_cache(self, headcount):
+        """
+        Load the whole active workforce into the employee cache in one query
+        Skipped when it would not fit: loading it would only evict itself
+        """
+        if headcount is None or headcount > self.employees.max_size:
+            print(f"Employee cache warm-up skipped: {headcount} active employees, cache holds {self.employees.max_size}")
+            return 0
+        return self.employees.put_many(self.fetch_all(self.EMPLOYEE_QUERY))
+    
+    def invalidate_employee(self, employee_code=None, employee_id=None):
+        """Drop a cached employee after it changed (photo, status, department...)"""
+        self.employees.invalidate(employee_code, employee_id)
     
     def get_today_attendance(self, employee_id):
         """Check if employee already checked in today"""
@@ -104,92 +343,437 @@ class Database:
         """
         return self.fetch_one(query, (employee_id, today))
     
-    def create_attendance_record(self, employee_id, check_in_photo=None, shift_id=1):
-        """Create new attendance record with check-in time and photo"""
-        now = datetime.now()
+    @staticmethod
+    def to_time(value):
+        """Convert a TIME column value (returned as timedelta or str) to datetime.time"""
+        if isinstance(value, str):
+            return datetime.strptime(value, "%H:%M:%S").time()
+        if isinstance(value, timedelta):
+            total_seconds = int(value.total_seconds())
+            hours = total_seconds // 3600
+            minutes = (total_seconds % 3600) // 60
+            seconds = total_seconds % 60
+            return datetime(1900, 1, 1, hours, minutes, seconds).time()
+        return value
+    
+    @staticmethod
+    def late_status(check_in_time):
+        """Late minutes and status for a check-in at check_in_time"""
         today = date.today()
-        current_time = now.time()
-        
-        # Calculate late minutes
         shift_start = datetime.strptime(config.DEFAULT_SHIFT_START, "%H:%M:%S").time()
         late_minutes = 0
         status = 'present'
         
-        if current_time > shift_start:
-            time_diff = datetime.combine(today, current_time) - datetime.combine(today, shift_start)
+        if check_in_time > shift_start:
+            time_diff = datetime.combine(today, check_in_time) - datetime.combine(today, shift_start)
             late_minutes = int(time_diff.total_seconds() / 60)
             if late_minutes > config.LATE_THRESHOLD_MINUTES:
                 status = 'late'
+        return late_minutes, status
+    
+    def record_attendance(self, employee_id, check_in_photo=None, check_out_photo=None, now=None, shift_id=1):
+        """
+        Check in or check out in one atomic upsert on unique_attendance
+        (employee_id, attendance_date, shift_id)
+        No row today: the check-in is inserted. Open row checked in at least
+        COOLDOWN_SECONDS ago: check-out is set and the hours are computed in the
+        same statement. Otherwise the row is left unchanged, so two kiosks
+        seeing the same person at once cannot double check-in or check out
+        right after checking in. When the row changed, the employee's month of
+        attendance_monthly_summary is recomputed in the same transaction, and
+        the row is read back for the reply: one multi-statement round trip.
+        A lost connection is not retried, since the write may already be applied.
+        Returns: (action, attendance) where action is 'check_in', 'check_out',
+        'cooldown' (checked in too recently) or 'complete' (already checked out),
+        or (None, None) on error
+        """
+        now = (now or datetime.now()).replace(microsecond=0)
+        today = now.date()
+        current_time = now.time()
+        late_minutes, status = self.late_status(current_time)
         
-        query = """
-            INSERT INTO attendance 
+        # MySQL applies ON DUPLICATE KEY assignments left to right, so check_out
+        # (tested by can_check_out) and check_in (tested by the check-in fill) go last
+        can_check_out = (
+            "check_out IS NULL AND check_in IS NOT NULL"
+            f" AND TIME_TO_SEC(TIMEDIFF(VALUES(check_in), check_in)) >= {int(config.COOLDOWN_SECONDS)}"
+        )
+        worked_hours = "TIME_TO_SEC(TIMEDIFF(VALUES(check_in), check_in)) / 3600"
+        query = f"""
+            INSERT INTO attendance
             (employee_id, shift_id, attendance_date, check_in, late_minutes, status, check_in_photo, check_in_method, check_out_method)
             VALUES (%s, %s, %s, %s, %s, %s, %s, 'face_recognition', NULL)
+            ON DUPLICATE KEY UPDATE
+                actual_hours = IF({can_check_out}, ROUND({worked_hours}, 2), actual_hours),
+                overtime_hours = IF({can_check_out}, ROUND(GREATEST(0, {worked_hours} - 8), 2), overtime_hours),
+                check_out_photo = IF({can_check_out}, %s, check_out_photo),
+                check_out_method = IF({can_check_out}, 'face_recognition', check_out_method),
+                check_out = IF({can_check_out}, VALUES(check_in), check_out),
+                late_minutes = IF(check_in IS NULL, VALUES(late_minutes), late_minutes),
+                status = IF(check_in IS NULL, VALUES(status), status),
+                check_in_photo = IF(check_in IS NULL, VALUES(check_in_photo), check_in_photo),
+                check_in_method = IF(check_in IS NULL, VALUES(check_in_method), check_in_method),
+                check_in = IFNULL(check_in, VALUES(check_in))
         """
-        return self.execute_query(
-            query, 
-            (employee_id, shift_id, today, current_time, late_minutes, status, check_in_photo)
-        )
-    
-    def update_checkout_time(self, attendance_id, check_out_photo=None):
-        """Update check-out time, calculate hours, and save photo"""
-        now = datetime.now()
-        current_time = now.time()
+        params = (employee_id, shift_id, today, current_time, late_minutes, status, check_in_photo, check_out_photo)
         
-        # Get the attendance record
-        attendance = self.fetch_one(
-            "SELECT * FROM attendance WHERE attendance_id = %s", 
-            (attendance_id,)
-        )
+        start, end = self._month_range(today.year, today.month)
+        # One round trip: the whole transaction goes to the server as a single multi-statement query
+        batch = ";".join([
+            "START TRANSACTION",
+            query,
+            # FOUND_ROWS is off: 1 = new row inserted, 2 = existing row updated, 0 = unchanged
+            "SET @attendance_changed = ROW_COUNT()",
+            self.EMPLOYEE_MONTH_SUMMARY,
+            "SELECT *, @attendance_changed AS attendance_changed FROM attendance"
+            " WHERE employee_id = %s AND attendance_date = %s AND shift_id = %s",
+            "COMMIT"
+        ])
+        params += (today.year, today.month, employee_id, start, end, employee_id, today, shift_id)
         
-        if not attendance or not attendance['check_in']:
+        def run(connection):
+            cursor = connection.cursor(dictionary=True)
+            try:
+                attendance = None
+                for result in cursor.execute(batch, params, multi=True):
+                    if result.with_rows:
+                        rows = result.fetchall()
+                        attendance = rows[0] if rows else None
+                if attendance is None:
+                    return None, None
+                
+                changed = attendance.pop('attendance_changed')
+                if changed:
+                    action = self._attendance_action(attendance, current_time)
+                else:
+                    action = 'complete' if attendance.get('check_out') is not None else 'cooldown'
+                return action, attendance
+            except CONNECTION_LOST_ERRORS:
+                raise
+            except Error:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+        try:
+            # Not retried on a lost connection: a replayed check-in would come back as a cooldown or a check-out
+            return self._run(run, retry=False)
+        except Error as e:
+            print(f"Query execution error: {e}")
+            return None, None
+    
+    ATTENDANCE_PHOTO_COLUMNS = ('check_in_photo', 'check_out_photo')
+    
+    def clear_attendance_photo(self, attendance_id, column, photo_path):
+        """Unset an attendance photo path whose file was never written (only if it still points at that file)"""
+        if column not in self.ATTENDANCE_PHOTO_COLUMNS:
+            raise ValueError(f"Unknown attendance photo column: {column}")
+        query = f"UPDATE attendance SET {column} = NULL WHERE attendance_id = %s AND {column} = %s"
+        return self.execute_query(query, (attendance_id, photo_path))
+    
+    def _attendance_action(self, attendance, current_time):
+        """What record_attendance did, judged from the row it read back"""
+        if not attendance:
             return None
+        check_out = self.to_time(attendance.get('check_out'))
+        if check_out == current_time:
+            return 'check_out'
+        if check_out is not None:
+            return 'complete'
+        if self.to_time(attendance.get('check_in')) == current_time:
+            return 'check_in'
+        return 'cooldown'
+    
+    @staticmethod
+    def _month_range(year, month):
+        """[first day, first day of next month) - a range MySQL can serve from idx_employee_date / idx_date"""
+        start = date(year, month, 1)
+        end = date(year + month // 12, month % 12 + 1, 1)
+        return start, end
+    
+    # One employee-month of attendance_monthly_summary, recomputed from its (at most 31 per shift)
+    # attendance rows through idx_employee_date. Runs in record_attendance's transaction right
+    # after its upsert, and only if that changed the row (@attendance_changed); the employee then
+    # has at least one row that month, so an upsert is enough
+    EMPLOYEE_MONTH_SUMMARY = """
+        INSERT INTO attendance_monthly_summary
+        (employee_id, year, month, total_days, present_days, late_days, absent_days, total_hours, total_overtime)
+        SELECT employee_id, %s, %s, COUNT(*),
+            SUM(status = 'present'), SUM(status = 'late'), SUM(status = 'absent'),
+            COALESCE(SUM(actual_hours), 0), COALESCE(SUM(overtime_hours), 0)
+        FROM attendance
+        WHERE @attendance_changed > 0 AND employee_id = %s AND attendance_date >= %s AND attendance_date < %s
+        GROUP BY employee_id
+        ON DUPLICATE KEY UPDATE
+            total_days = VALUES(total_days),
+            present_days = VALUES(present_days),
+            late_days = VALUES(late_days),
+            absent_days = VALUES(absent_days),
+            total_hours = VALUES(total_hours),
+            total_overtime = VALUES(total_overtime)
+    """
+    
+    def _refresh_monthly_summary(self, cursor, year, month, employee_id=None):
+        """Recompute one month of attendance_monthly_summary (one employee, or everybody) from attendance"""
+        start, end = self._month_range(year, month)
+        employee_filter = " AND employee_id = %s" if employee_id is not None else ""
+        extra = (employee_id,) if employee_id is not None else ()
+        # Employees whose rows all disappeared must not keep a stale summary
+        cursor.execute(
+            "DELETE FROM attendance_monthly_summary WHERE year = %s AND month = %s" + employee_filter,
+            (year, month) + extra
+        )
+        cursor.execute(f"""
+            INSERT INTO attendance_monthly_summary
+            (employee_id, year, month, total_days, present_days, late_days, absent_days, total_hours, total_overtime)
+            SELECT employee_id, %s, %s, COUNT(*),
+                SUM(status = 'present'), SUM(status = 'late'), SUM(status = 'absent'),
+                COALESCE(SUM(actual_hours), 0), COALESCE(SUM(overtime_hours), 0)
+            FROM attendance
+            WHERE attendance_date >= %s AND attendance_date < %s{employee_filter}
+            GROUP BY employee_id
+        """, (year, month, start, end) + extra)
+    
+    def refresh_monthly_summary(self, year, month, employee_id=None):
+        """Rebuild one month of the summary from attendance in a single transaction"""
+        def run(connection):
+            cursor = connection.cursor()
+            try:
+                connection.start_transaction()
+                self._refresh_monthly_summary(cursor, year, month, employee_id)
+                connection.commit()
+                return True
+            except CONNECTION_LOST_ERRORS:
+                raise
+            except Error:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+        try:
+            return self._run(run)
+        except Error as e:
+            print(f"Query execution error: {e}")
+            return False
+    
+    def get_monthly_summary(self, employee_id, year, month):
+        """One employee's attendance totals for a month (primary key lookup)"""
+        query = """
+            SELECT total_days, present_days, late_days, absent_days, total_hours, total_overtime
+            FROM attendance_monthly_summary
+            WHERE employee_id = %s AND year = %s AND month = %s
+        """
+        return self.fetch_one(query, (employee_id, year, month))
+    
+    def get_employee_ids_by_codes(self, employee_codes, chunk_size=1000):
+        """employee_code -> employee_id of the active employees among employee_codes"""
+        employee_codes = list(employee_codes)
+        ids = {}
+        for start in range(0, len(employee_codes), chunk_size):
+            chunk = employee_codes[start:start + chunk_size]
+            query = f"""
+                SELECT employee_id, employee_code FROM employees
+                WHERE status = 'active' AND employee_code IN ({', '.join(['%s'] * len(chunk))})
+            """
+            for row in self.fetch_all(query, tuple(chunk)):
+                ids[row['employee_code']] = row['employee_id']
+        return ids
+    
+    def update_employee_face_photos(self, photos, chunk_size=1000):
+        """
+        Set face_photo for many employees: photos is a list of (employee_id, photo_path).
+        Each chunk is a single UPDATE ... SET face_photo = CASE employee_id ... END
+        statement, i.e. one round trip per chunk rather than one per employee.
+        Returns the number of employees written
+        """
+        photos = list(photos)
         
-        # Calculate actual hours
-        check_in = attendance['check_in']
-        
-        # Convert check_in to time object if needed
-        if isinstance(check_in, str):
-            check_in = datetime.strptime(check_in, "%H:%M:%S").time()
-        elif isinstance(check_in, timedelta):
-            # Convert timedelta to time
-            total_seconds = int(check_in.total_seconds())
-            hours = total_seconds // 3600
-            minutes = (total_seconds % 3600) // 60
-            seconds = total_seconds % 60
-            check_in = datetime(1900, 1, 1, hours, minutes, seconds).time()
-        elif not isinstance(check_in, datetime.time):
-            # If it's already a time object, use it directly
-            check_in = check_in
-        
-        today = date.today()
-        time_diff = datetime.combine(today, current_time) - datetime.combine(today, check_in)
-        actual_hours = time_diff.total_seconds() / 3600
-        
-        # Calculate overtime (if worked more than 8 hours)
-        overtime_hours = max(0, actual_hours - 8)
-        
+        def run(connection, query, params):
+            cursor = connection.cursor()
+            try:
+                cursor.execute(query, params)
+                connection.commit()
+                return True
+            except CONNECTION_LOST_ERRORS:
+                raise
+            except Error:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+        written = 0
+        for start in range(0, len(photos), chunk_size):
+            chunk = photos[start:start + chunk_size]
+            query = f"""
+                UPDATE employees
+                SET face_photo = CASE employee_id {' '.join(['WHEN %s THEN %s'] * len(chunk))} END
+                WHERE employee_id IN ({', '.join(['%s'] * len(chunk))})
+            """
+            params = tuple([value for pair in chunk for value in pair] + [employee_id for employee_id, _ in chunk])
+            try:
+                self._run(lambda connection: run(connection, query, params))
+                written += len(chunk)
+            except Error as e:
+                print(f"Query execution error: {e}")
+            for employee_id, _ in chunk:
+                self.invalidate_employee(employee_id=employee_id)
+        return written
+    
+    ATTENDANCE_STATUSES = ('present', 'absent', 'late', 'half_day', 'leave')
+    
+    @staticmethod
+    def _summary_months(start, end, statuses):
+        """
+        Parameters of SUMMARY_MONTHS for [start, end) when it covers whole calendar
+        months and no status filter applies, i.e. when the summary table can answer it
+        """
+        if statuses or start.day != 1 or end.day != 1 or end <= start:
+            return None
+        last = end - timedelta(days=1)
+        return (start.year, last.year, start.year, start.month, last.year, last.month)
+    
+    # (year, month) from the first to the last month of a range, on the bare key columns so
+    # MySQL can range-scan the primary key (after employee_id) or idx_year_month_updated
+    SUMMARY_MONTHS = """
+        {p}year BETWEEN %s AND %s
+        AND ({p}year > %s OR {p}month >= %s)
+        AND ({p}year < %s OR {p}month <= %s)
+    """
+    
+    def get_bulk_attendance_stats(self, start, end, department_id=None, statuses=None):
+        """
+        Attendance totals over [start, end) for every active employee (optionally of one
+        department) in one grouped query. Whole months without a status filter are summed
+        from attendance_monthly_summary, anything else is aggregated from attendance over
+        a date range that idx_employee_date can serve
+        """
+        months = self._summary_months(start, end, statuses)
+        if months:
+            source = """
+                LEFT JOIN attendance_monthly_summary s ON s.employee_id = e.employee_id
+                    AND """ + self.SUMMARY_MONTHS.format(p="s.") + """
+            """
+            aggregates = """
+                COALESCE(SUM(s.total_days), 0) AS total_days,
+                COALESCE(SUM(s.present_days), 0) AS present_days,
+                COALESCE(SUM(s.late_days), 0) AS late_days,
+                COALESCE(SUM(s.absent_days), 0) AS absent_days,
+                COALESCE(SUM(s.total_hours), 0) AS total_hours,
+                COALESCE(SUM(s.total_overtime), 0) AS total_overtime
+            """
+            params = list(months)
+        else:
+            source = """
+                LEFT JOIN attendance a ON a.employee_id = e.employee_id
+                    AND a.attendance_date >= %s AND a.attendance_date < %s
+            """
+            params = [start, end]
+            if statuses:
+                source += f" AND a.status IN ({', '.join(['%s'] * len(statuses))})"
+                params.extend(statuses)
+            aggregates = """
+                COUNT(a.attendance_id) AS total_days,
+                COALESCE(SUM(a.status = 'present'), 0) AS present_days,
+                COALESCE(SUM(a.status = 'late'), 0) AS late_days,
+                COALESCE(SUM(a.status = 'absent'), 0) AS absent_days,
+                COALESCE(SUM(a.actual_hours), 0) AS total_hours,
+                COALESCE(SUM(a.overtime_hours), 0) AS total_overtime
+            """
+        query = f"""
+            SELECT e.employee_id, e.employee_code, e.full_name, e.department_id, {aggregates}
+            FROM employees e
+            {source}
+            WHERE e.status = 'active'
+        """
+        if department_id is not None:
+            query += " AND e.department_id = %s"
+            params.append(department_id)
+        query += " GROUP BY e.employee_id ORDER BY e.employee_id"
+        return self.fetch_all(query, tuple(params))
+    
+    def get_attendance_stats_marker(self, start, end, statuses=None):
+        """
+        Cheap change marker for get_bulk_attendance_stats(): row count and last update of
+        the employees and of the attendance (or summary) rows in range. Index-only lookups
+        (idx_year_month_updated on the summary), no aggregation per employee
+        """
+        months = self._summary_months(start, end, statuses)
+        if months:
+            rows = """
+                SELECT COUNT(*) AS row_count, MAX(updated_at) AS last_updated
+                FROM attendance_monthly_summary WHERE """ + self.SUMMARY_MONTHS.format(p="") + """
+            """
+            params = months
+        else:
+            rows = """
+                SELECT COUNT(*) AS row_count, MAX(updated_at) AS last_updated
+                FROM attendance WHERE attendance_date >= %s AND attendance_date < %s
+            """
+            params = (start, end)
+        query = f"""
+            SELECT r.row_count, r.last_updated, e.employee_count, e.employees_updated
+            FROM ({rows}) r
+            CROSS JOIN (SELECT COUNT(*) AS employee_count, MAX(updated_at) AS employees_updated FROM employees) e
+        """
+        return self.fetch_one(query, params)
+    
+    ATTENDANCE_EXPORT_COLUMNS = (
+        'attendance_id', 'attendance_date', 'employee_id', 'employee_code', 'full_name', 'department_id',
+        'shift_id', 'check_in', 'check_out', 'actual_hours', 'overtime_hours', 'late_minutes',
+        'early_leave_minutes', 'status', 'check_in_method', 'check_out_method'
+    )
+    
+    def stream_attendance(self, start, end, department_id=None):
+        """Raw attendance rows in [start, end) with employee code and name, streamed (see stream())"""
         query = """
-            UPDATE attendance 
-            SET check_out = %s, actual_hours = %s, overtime_hours = %s, check_out_photo = %s, check_out_method = 'face_recognition'
-            WHERE attendance_id = %s
+            SELECT a.attendance_id, a.attendance_date, a.employee_id, e.employee_code, e.full_name, e.department_id,
+                a.shift_id, a.check_in, a.check_out, a.actual_hours, a.overtime_hours, a.late_minutes,
+                a.early_leave_minutes, a.status, a.check_in_method, a.check_out_method
+            FROM attendance a
+            JOIN employees e ON e.employee_id = a.employee_id
+            WHERE a.attendance_date >= %s AND a.attendance_date < %s
         """
-        self.execute_query(
-            query, 
-            (current_time, round(actual_hours, 2), round(overtime_hours, 2), check_out_photo, attendance_id)
-        )
-        return attendance_id
+        params = [start, end]
+        if department_id is not None:
+            query += " AND e.department_id = %s"
+            params.append(department_id)
+        query += " ORDER BY a.attendance_date, a.employee_id, a.shift_id"
+        return self.stream(query, tuple(params))
     
     def update_employee_face_photo(self, employee_id, photo_path):
         """Update employee's face photo path"""
         query = "UPDATE employees SET face_photo = %s WHERE employee_id = %s"
-        return self.execute_query(query, (photo_path, employee_id))
+        result = self.execute_query(query, (photo_path, employee_id))
+        self.invalidate_employee(employee_id=employee_id)
+        return result
     
-    def get_all_active_employees_with_photos(self):
-        """Get all active employees who have face photos"""
-        query = """
-            SELECT employee_id, employee_code, full_name, face_photo
+    EMPLOYEE_PHOTO_FIELDS = (
+        'employee_id', 'employee_code', 'full_name', 'face_photo', 'department_id', 'position_id', 'updated_at'
+    )
+    EMPLOYEE_PHOTO_DEFAULT_FIELDS = ('employee_id', 'employee_code', 'full_name', 'face_photo')
+    EMPLOYEES_WITH_PHOTOS = "status = 'active' AND face_photo IS NOT NULL AND face_photo != ''"
+    
+    def get_employees_with_photos_page(self, after_id=0, limit=500, fields=None):
+        """
+        One keyset page of active employees with face photos: employee_id > after_id in
+        employee_id order, served by a PRIMARY KEY range scan (no OFFSET to skip over).
+        fields must come from EMPLOYEE_PHOTO_FIELDS; employee_id is always returned
+        """
+        fields = [field for field in (fields or self.EMPLOYEE_PHOTO_DEFAULT_FIELDS) if field in self.EMPLOYEE_PHOTO_FIELDS]
+        columns = ['employee_id'] + [field for field in fields if field != 'employee_id']
+        query = f"""
+            SELECT {', '.join(columns)}
             FROM employees
-            WHERE status = 'active' AND face_photo IS NOT NULL AND face_photo != ''
+            WHERE {self.EMPLOYEES_WITH_PHOTOS} AND employee_id > %s
+            ORDER BY employee_id
+            LIMIT %s
+        """
+        return self.fetch_all(query, (after_id, limit))
+    
+    def get_employees_with_photos_marker(self):
+        """Cheap change marker for the listing: last update of any employee (idx_updated) and the listed row count"""
+        query = f"""
+            SELECT (SELECT MAX(updated_at) FROM employees) AS last_updated,
+                (SELECT COUNT(*) FROM employees WHERE {self.EMPLOYEES_WITH_PHOTOS}) AS row_count
         """
-        return self.fetch_all(query)
+        return self.fetch_one(query)
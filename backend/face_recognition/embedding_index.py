@@ -0,0 +1,277 @@
+"""
+Resident in-memory embedding index for face recognition
+Keeps a matrix of L2-normalised employee embeddings and a parallel array of
+employee codes, searched with a single vectorised matrix-vector product
+(or, with INDEX_MODE = "ivf", an approximate IVF search with exact rescoring,
+falling back to the full scan when the IVF result is not a clear match)
+"""
+import threading
+import numpy as np
+from pathlib import Path
+from typing import List, Tuple, Optional
+import config
+from embedding_store import EmbeddingStore
+from ann_index import IVFIndex
+
+
+class EmbeddingIndex:
+    # Rows are L2-normalised, so plain euclidean distances would really be euclidean_l2
+    # and not on the scale a raw-euclidean SIMILARITY_THRESHOLD was chosen for
+    METRICS = ("cosine", "euclidean_l2")
+
+    def __init__(self, dim: Optional[int] = None, metric: str = None, mode: str = None):
+        self.dim = dim
+        self.metric = metric or config.DISTANCE_METRIC
+        if self.metric not in self.METRICS:
+            raise ValueError(
+                f"DISTANCE_METRIC '{self.metric}' không được hỗ trợ. Chọn một trong: {', '.join(self.METRICS)}"
+            )
+        self.mode = mode or config.INDEX_MODE
+        self.ann: Optional[IVFIndex] = None
+        self._rows = None  # employee_code -> row indices, built lazily, then kept up to date
+        self.changes = 0  # upserts/removals since the IVF clusters were last fitted
+        self.embeddings = np.zeros((0, dim or 0), dtype=np.float32)
+        self.codes = np.array([], dtype=object)
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.codes)
+
+    @staticmethod
+    def normalize(vectors) -> np.ndarray:
+        """L2-normalise one vector or a matrix of row vectors"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def load(self, embeddings, codes, normalized: bool = False):
+        """
+        Replace the whole index with the given embeddings and codes
+        normalized=True keeps already unit-length float32 rows (e.g. a memmap) without copying
+        """
+        if normalized and embeddings.dtype == np.float32:
+            embeddings = np.atleast_2d(embeddings)
+        else:
+            embeddings = self.normalize(np.atleast_2d(embeddings))
+        codes = np.asarray(list(codes), dtype=object)
+        if len(embeddings) != len(codes):
+            raise ValueError("Số lượng embedding và mã nhân viên không khớp")
+        with self._lock:
+            self.embeddings = embeddings
+            self.codes = codes
+            self.dim = embeddings.shape[1] if len(codes) else self.dim
+            self._rows = None
+            self.ann = None
+            self.changes = 0
+            self._train_ann()
+
+    def _train_ann(self):
+        """(Re)build the IVF structure when ANN mode is on and the gallery is big enough"""
+        if self.mode != "ivf" or len(self.codes) < config.IVF_MIN_SIZE:
+            self.ann = None
+            return
+        nlist = config.IVF_NLIST or int(np.sqrt(len(self.codes)))
+        ann = IVFIndex(
+            nlist=nlist,
+            nprobe=config.IVF_NPROBE,
+            iterations=config.IVF_TRAIN_ITERATIONS
+        )
+        ann.train(self.embeddings)
+        self.ann = ann
+        self.changes = 0
+
+    def retrain(self, min_changes: int = 0) -> bool:
+        """
+        Refit the IVF clusters, e.g. after many enrollments have shifted the gallery
+        Skipped (returns False) if fewer than min_changes updates happened since the last fit
+        """
+        with self._lock:
+            if self.changes < min_changes:
+                return False
+            self._train_ann()
+            self.changes = 0
+            return True
+
+    def upsert(self, employee_code: str, embedding):
+        """Insert or replace the embedding(s) of one employee (one vector or a matrix of rows)"""
+        vector = self.normalize(np.atleast_2d(np.asarray(embedding)))
+        with self._lock:
+            if len(self.codes) == 0:
+                self.embeddings = vector
+                self.codes = np.array([employee_code] * len(vector), dtype=object)
+                self._rows = None
+            else:
+                self._replace_rows(employee_code, vector)
+            self.dim = vector.shape[1]
+            self.changes += 1
+            if self.ann is None and self.mode == "ivf" and len(self.codes) >= config.IVF_MIN_SIZE:
+                self._train_ann()
+
+    def remove(self, employee_code: str) -> bool:
+        """Remove every embedding of one employee. Returns True if anything was removed"""
+        with self._lock:
+            if len(self._rows_of(employee_code)) == 0:
+                return False
+            self._replace_rows(employee_code, np.zeros((0, self.embeddings.shape[1]), dtype=np.float32))
+            self.changes += 1
+            return True
+
+    def _replace_rows(self, employee_code: str, vectors: np.ndarray):
+        """
+        Swap one employee's rows for `vectors` (possibly none) with a single copy of the matrix
+        (call with the lock held). The last surviving rows move into the freed rows and every
+        other row keeps its index, so only the moved rows' entries in the row map change
+        """
+        removed = self._rows_of(employee_code)
+        size = len(self.codes) - len(removed)
+        holes = removed[removed < size]
+        tail = np.setdiff1d(np.arange(size, len(self.codes)), removed)
+
+        moved = {}
+        for hole, row in zip(holes.tolist(), tail.tolist()):
+            moved.setdefault(self.codes[row], {})[row] = hole
+        for code, new_rows in moved.items():
+            self._rows[code] = np.array([new_rows.get(row, row) for row in self._rows[code].tolist()])
+
+        embeddings = np.empty((size + len(vectors), self.embeddings.shape[1]), dtype=np.float32)
+        embeddings[:size] = self.embeddings[:size]
+        embeddings[holes] = self.embeddings[tail]
+        embeddings[size:] = vectors
+        codes = np.append(self.codes[:size], np.array([employee_code] * len(vectors), dtype=object))
+        codes[holes] = self.codes[tail]
+        self.embeddings = embeddings
+        self.codes = codes
+        if len(vectors):
+            self._rows[employee_code] = np.arange(size, size + len(vectors))
+        else:
+            self._rows.pop(employee_code, None)
+
+        if self.ann:
+            order = np.arange(size)
+            order[holes] = tail
+            self.ann.take(order)
+            self.ann.append(vectors)
+
+    def _rows_of(self, employee_code: str) -> np.ndarray:
+        """Row indices of one employee (call with the lock held)"""
+        if self._rows is None:
+            unique, inverse = np.unique(self.codes.astype(str), return_inverse=True)
+            order = np.argsort(inverse, kind='stable')
+            bounds = np.searchsorted(inverse[order], np.arange(len(unique) + 1))
+            self._rows = {code: order[bounds[k]:bounds[k + 1]] for k, code in enumerate(unique.tolist())}
+        return self._rows.get(employee_code, np.zeros(0, dtype=np.int64))
+
+    def __contains__(self, employee_code: str) -> bool:
+        with self._lock:
+            return len(self._rows_of(employee_code)) > 0
+
+    def get(self, employee_code: str) -> np.ndarray:
+        """Copy of the stored rows of one employee (empty matrix if none)"""
+        with self._lock:
+            rows = self._rows_of(employee_code)
+            return np.array(self.embeddings[rows], dtype=np.float32)
+
+    def verify(self, employee_code: str, embedding) -> Optional[float]:
+        """
+        1:1 comparison against one employee's stored template(s) only
+        Returns: the smallest distance, or None if the employee has no template
+        """
+        with self._lock:
+            rows = self._rows_of(employee_code)
+            templates = self.embeddings[rows] if len(rows) else None
+        if templates is None:
+            return None
+        probe = self.normalize(np.asarray(embedding).reshape(-1))
+        return float(self._to_distance(templates @ probe).min())
+
+    def save(self, path: Path):
+        """Persist the index as a new version of the on-disk embedding store"""
+        with self._save_lock:
+            with self._lock:
+                embeddings, codes = self.embeddings, self.codes
+            EmbeddingStore(path).write(embeddings, codes.tolist())
+
+    def load_file(self, path: Path) -> bool:
+        """Memory-map a saved embedding store. Returns False if it is missing or stale"""
+        stored = EmbeddingStore(path).open()
+        if stored is None:
+            return False
+        embeddings, codes = stored
+        self.load(embeddings, codes, normalized=True)
+        return True
+
+    def _to_distance(self, similarities: np.ndarray) -> np.ndarray:
+        """Convert cosine similarities of unit vectors to the configured distance"""
+        if self.metric == "cosine":
+            return 1.0 - similarities
+        # euclidean_l2: euclidean distance of unit vectors
+        return np.sqrt(np.maximum(2.0 - 2.0 * similarities, 0.0))
+
+    def search(self, embedding, top_k: int = 1) -> List[Tuple[str, float]]:
+        """
+        Find the closest employees to a probe embedding
+        Returns: list of (employee_code, distance) sorted by distance
+        """
+        return self.search_many(np.asarray(embedding).reshape(1, -1), top_k)[0]
+
+    def search_many(self, embeddings, top_k: int = 1) -> List[List[Tuple[str, float]]]:
+        """
+        Search several probe embeddings with one matrix-matrix product
+        Returns: one list of (employee_code, distance) per probe, sorted by distance
+        """
+        probes = self.normalize(np.atleast_2d(embeddings))
+        with self._lock:
+            embeddings, codes = self.embeddings, self.codes
+            # Candidate rows are looked up under the lock so they match this snapshot
+            candidate_rows = self.ann.candidates(probes) if self.ann else None
+        if len(codes) == 0:
+            return [[] for _ in range(len(probes))]
+
+        if candidate_rows is None:
+            return self._search_exact(embeddings, codes, probes, top_k)
+
+        results = [
+            self._search_candidates(embeddings, codes, probe, rows, top_k)
+            for probe, rows in zip(probes, candidate_rows)
+        ]
+        # IVF can miss the right cluster. A probe whose best candidate is not a clear match
+        # (near or over the threshold) is rescored against the whole gallery, so a missed
+        # employee is never reported as unknown or beaten by a borderline wrong match
+        cutoff = config.SIMILARITY_THRESHOLD - config.IVF_EXACT_MARGIN
+        unsure = [i for i, result in enumerate(results) if not result or result[0][1] > cutoff]
+        if unsure:
+            for i, result in zip(unsure, self._search_exact(embeddings, codes, probes[unsure], top_k)):
+                results[i] = result
+        return results
+
+    def _search_exact(self, embeddings, codes, probes, top_k: int) -> List[List[Tuple[str, float]]]:
+        """Brute-force scan of every row for each probe"""
+        similarities = probes @ embeddings.T
+
+        top_k = min(top_k, len(codes))
+        if top_k < len(codes):
+            candidates = np.argpartition(-similarities, top_k - 1, axis=1)[:, :top_k]
+        else:
+            candidates = np.tile(np.arange(len(codes)), (len(probes), 1))
+        candidate_sims = np.take_along_axis(similarities, candidates, axis=1)
+        order = np.argsort(-candidate_sims, axis=1)
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        distances = self._to_distance(np.take_along_axis(candidate_sims, order, axis=1))
+
+        return [
+            [(codes[i], float(d)) for i, d in zip(row_candidates, row_distances)]
+            for row_candidates, row_distances in zip(candidates, distances)
+        ]
+
+    def _search_candidates(self, embeddings, codes, probe, rows, top_k: int) -> List[Tuple[str, float]]:
+        """Exactly rescore the IVF candidate rows of one probe"""
+        if len(rows) == 0:
+            return []
+        similarities = embeddings[rows] @ probe
+        top_k = min(top_k, len(rows))
+        best = np.argpartition(-similarities, top_k - 1)[:top_k]
+        best = best[np.argsort(-similarities[best])]
+        distances = self._to_distance(similarities[best])
+        return [(codes[rows[i]], float(d)) for i, d in zip(best, distances)]
@@ -0,0 +1,125 @@
+"""
+Memory-mapped, versioned on-disk embedding store
+
+File layout:
+    8 bytes   magic + format version (b"HRMEMB01")
+    4 bytes   header length (little-endian uint32)
+    N bytes   JSON header: model, detector, normalization, dim, dtype, count, codes
+    padding   up to a 64-byte boundary
+    matrix    count x dim contiguous float32/float16 rows (L2-normalised)
+
+The matrix is opened read-only with np.memmap, so every worker process
+maps the same page-cache pages instead of unpickling its own copy.
+"""
+import json
+import os
+import struct
+import threading
+import numpy as np
+from pathlib import Path
+from typing import List, Tuple, Optional, Dict
+import config
+
+MAGIC = b"HRMEMB01"
+ALIGNMENT = 64
+
+# Stores are short-lived objects (one per save), so the lock that keeps two writers of the
+# same file off its shared temp file lives here, one per path
+_write_locks: Dict[Path, threading.Lock] = {}
+_write_locks_guard = threading.Lock()
+
+
+def _write_lock(path: Path) -> threading.Lock:
+    with _write_locks_guard:
+        return _write_locks.setdefault(path.resolve(), threading.Lock())
+
+
+def _store_signature() -> Dict:
+    """Settings an embedding was produced with; a mismatch means the store is stale"""
+    return {
+        'model': config.FACE_RECOGNITION_MODEL,
+        'detector': config.DETECTOR_BACKEND,
+        'normalization': config.EMBEDDING_NORMALIZATION,
+    }
+
+
+class EmbeddingStore:
+    def __init__(self, path: Path, dtype: str = None):
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype or config.EMBEDDING_STORE_DTYPE)
+
+    def read_header(self) -> Optional[Dict]:
+        """Read the JSON header without touching the matrix"""
+        if not self.path.exists():
+            return None
+        with open(self.path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            (header_len,) = struct.unpack("<I", f.read(4))
+            return json.loads(f.read(header_len).decode('utf-8'))
+
+    def open(self) -> Optional[Tuple[np.ndarray, List[str]]]:
+        """
+        Map the stored matrix read-only
+        Returns: (embeddings, codes) or None if missing, corrupt or built with other settings
+        """
+        try:
+            header = self.read_header()
+        except Exception as e:
+            print(f"Error reading embedding store: {e}")
+            return None
+        if header is None:
+            return None
+
+        signature = _store_signature()
+        if any(header.get(key) != value for key, value in signature.items()):
+            print("Embedding store was built with different model settings, ignoring it")
+            return None
+
+        count, dim = header['count'], header['dim']
+        if count == 0:
+            return np.zeros((0, dim), dtype=np.float32), []
+
+        embeddings = np.memmap(
+            self.path,
+            dtype=np.dtype(header['dtype']),
+            mode='r',
+            offset=header['data_offset'],
+            shape=(count, dim)
+        )
+        return embeddings, header['codes']
+
+    def write(self, embeddings: np.ndarray, codes: List[str]):
+        """Write a new version of the store atomically (temp file, fsync, rename)"""
+        embeddings = np.ascontiguousarray(embeddings, dtype=self.dtype)
+        count = len(codes)
+        dim = embeddings.shape[1] if embeddings.ndim == 2 else 0
+
+        header = dict(_store_signature())
+        header.update({
+            'dim': dim,
+            'dtype': self.dtype.name,
+            'count': count,
+            'codes': [str(code) for code in codes],
+            'data_offset': 0,
+        })
+
+        # data_offset is part of the header, so size it with a placeholder first
+        header_bytes = json.dumps(header).encode('utf-8')
+        prefix_len = len(MAGIC) + 4 + len(header_bytes) + 16
+        header['data_offset'] = -(-prefix_len // ALIGNMENT) * ALIGNMENT
+        header_bytes = json.dumps(header).encode('utf-8')
+        padding = header['data_offset'] - (len(MAGIC) + 4 + len(header_bytes))
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with _write_lock(self.path):
+            with open(temp_path, 'wb') as f:
+                f.write(MAGIC)
+                f.write(struct.pack("<I", len(header_bytes)))
+                f.write(header_bytes)
+                f.write(b"\0" * padding)
+                f.write(embeddings.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
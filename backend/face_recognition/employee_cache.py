@@ -0,0 +1,116 @@
+"""
+In-process employee metadata cache
+Recognition only needs an employee's name, department and position, which
+hardly change during a shift, so the three-table JOIN is paid once per
+employee instead of once per face. Entries are evicted least-recently-used
+beyond max_size and expire after ttl_seconds; writes that change an
+employee (photo enrolment, status change) invalidate it explicitly.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+
+class EmployeeCache:
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._entries = OrderedDict()  # employee_code -> (expires_at, employee row)
+        self._codes_by_id = {}  # employee_id -> employee_code
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, employee_code: str):
+        _, employee = self._entries.pop(employee_code)
+        self._codes_by_id.pop(employee['employee_id'], None)
+
+    def get_by_code(self, employee_code: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(employee_code)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, employee = entry
+            if time.monotonic() >= expires_at:
+                self._drop(employee_code)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(employee_code)
+            self.hits += 1
+            return employee
+
+    def get_by_id(self, employee_id) -> Optional[Dict]:
+        with self._lock:
+            employee_code = self._codes_by_id.get(employee_id)
+        if employee_code is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        return self.get_by_code(employee_code)
+
+    def put(self, employee: Dict):
+        with self._lock:
+            self._put(employee, time.monotonic() + self.ttl)
+
+    def _put(self, employee: Dict, expires_at: float):
+        employee_code = employee['employee_code']
+        if employee_code in self._entries:
+            self._drop(employee_code)
+        self._entries[employee_code] = (expires_at, employee)
+        self._codes_by_id[employee['employee_id']] = employee_code
+        while len(self._entries) > self.max_size:
+            self._drop(next(iter(self._entries)))
+
+    def resize(self, max_size: int):
+        """Change the capacity, evicting least-recently-used entries if it shrinks"""
+        with self._lock:
+            self.max_size = max_size
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def put_many(self, employees: Iterable[Dict]) -> int:
+        """Load many rows at once (cache warm-up). Returns the number cached"""
+        count = 0
+        with self._lock:
+            expires_at = time.monotonic() + self.ttl
+            for employee in employees:
+                self._put(employee, expires_at)
+                count += 1
+        return min(count, self.max_size)
+
+    def invalidate(self, employee_code: str = None, employee_id=None):
+        """Forget one employee, by code and/or id"""
+        with self._lock:
+            if employee_code is None and employee_id is not None:
+                employee_code = self._codes_by_id.get(employee_id)
+            if employee_code in self._entries:
+                self._drop(employee_code)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._codes_by_id.clear()
+
+    def prune(self) -> int:
+        """Drop expired entries. Returns the number removed"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [code for code, (expires_at, _) in self._entries.items() if now >= expires_at]
+            for employee_code in expired:
+                self._drop(employee_code)
+        return len(expired)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
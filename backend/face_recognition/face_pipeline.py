@@ -0,0 +1,148 @@
+"""
+Single-pass face pipeline
+Decodes an image once, detects faces once and feeds the aligned crop
+straight to the embedding model
+"""
+import base64
+from deepface import DeepFace
+from deepface.modules import preprocessing
+import cv2
+import numpy as np
+from typing import Tuple, Optional, Dict, List, Union
+import config
+
+ImageInput = Union[str, np.ndarray]
+
+
+def decode_image(image_data) -> Optional[np.ndarray]:
+    """
+    Decode an uploaded image straight into a BGR array, without temp files
+    Accepts a file object (e.g. werkzeug FileStorage), raw bytes or a base64/data-URL string
+    Returns None if the data is not a decodable image
+    """
+    if isinstance(image_data, str):
+        # If base64 string
+        image_data = base64.b64decode(image_data.split(',')[1] if ',' in image_data else image_data)
+    elif hasattr(image_data, 'read'):
+        # If file object
+        image_data = image_data.read()
+
+    buffer = np.frombuffer(image_data, dtype=np.uint8)
+    if buffer.size == 0:
+        return None
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+
+def load_image(image: ImageInput) -> Optional[np.ndarray]:
+    """Decode an image path once; decoded BGR arrays pass through"""
+    if isinstance(image, np.ndarray):
+        return image
+    return cv2.imread(str(image))
+
+
+class FacePipeline:
+    def __init__(self):
+        self.model = DeepFace.build_model(config.FACE_RECOGNITION_MODEL)
+        self.target_size = self.model.input_shape
+
+    def detect(self, img: np.ndarray, enforce_detection: bool = True) -> Tuple[bool, str, Optional[Dict]]:
+        """
+        Detect faces once and run the quality checks on that result
+        Returns: (success, message, face) where face is the DeepFace face object
+        """
+        try:
+            faces = DeepFace.extract_faces(
+                img_path=img,
+                detector_backend=config.DETECTOR_BACKEND,
+                enforce_detection=enforce_detection
+            )
+        except Exception as e:
+            return False, f"Lỗi xác thực ảnh: {str(e)}", None
+
+        if len(faces) == 0:
+            return False, "Không phát hiện khuôn mặt trong ảnh", None
+
+        if not enforce_detection:
+            # Enrollment path: accept the best face without quality checks
+            return True, "Ảnh hợp lệ", faces[0]
+
+        if len(faces) > 1:
+            return False, "Phát hiện nhiều hơn 1 khuôn mặt. Vui lòng chỉ có 1 người trong ảnh", None
+
+        # Check face confidence
+        face = faces[0]
+        if face.get('confidence', 0) < 0.9:
+            return False, "Khuôn mặt không đủ rõ ràng. Vui lòng chụp lại với ánh sáng tốt hơn", None
+
+        # Check image quality on the already decoded frame
+        height, width = img.shape[:2]
+        if width < config.PHOTO_QUALITY_MIN_WIDTH or height < config.PHOTO_QUALITY_MIN_HEIGHT:
+            return False, f"Ảnh quá nhỏ. Kích thước tối thiểu: {config.PHOTO_QUALITY_MIN_WIDTH}x{config.PHOTO_QUALITY_MIN_HEIGHT}px", None
+
+        return True, "Ảnh hợp lệ", face
+
+    def preprocess(self, face: Dict) -> np.ndarray:
+        """Turn an aligned RGB face crop into a model input batch of one"""
+        # rgb to bgr, as DeepFace.represent does
+        crop = face['face'][:, :, ::-1]
+        crop = preprocessing.resize_image(
+            img=crop,
+            target_size=(self.target_size[1], self.target_size[0])
+        )
+        return preprocessing.normalize_input(img=crop, normalization=config.EMBEDDING_NORMALIZATION)
+
+    def embed(self, face: Dict) -> np.ndarray:
+        """Compute the embedding of an already detected face"""
+        embedding = self.model.forward(self.preprocess(face))
+        return np.asarray(embedding, dtype=np.float32)
+
+    def embed_batch(self, faces: List[Dict]) -> np.ndarray:
+        """Compute embeddings for many detected faces in a single forward pass"""
+        if not faces:
+            return np.zeros((0, 0), dtype=np.float32)
+        batch = np.vstack([self.preprocess(face) for face in faces])
+        embeddings = self.model.model(batch, training=False).numpy()
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def process(self, image: ImageInput, enforce_detection: bool = True) -> Tuple[bool, str, Optional[np.ndarray]]:
+        """
+        Decode, detect and embed an image in a single pass
+        Returns: (success, message, embedding)
+        """
+        img = load_image(image)
+        if img is None:
+            return False, "Không thể đọc file ảnh", None
+
+        is_valid, msg, face = self.detect(img, enforce_detection)
+        if not is_valid:
+            return False, msg, None
+
+        return True, msg, self.embed(face)
+
+    def process_many(self, images: List[ImageInput]) -> List[Tuple[bool, str, Optional[np.ndarray]]]:
+        """
+        Detect faces image by image, then embed every crop in one forward pass
+        Returns: one (success, message, embedding) per image, in order
+        """
+        results = [None] * len(images)
+
+        # Detect faces one image at a time (detectors are not batched)
+        faces, positions = [], []
+        for i, image in enumerate(images):
+            img = load_image(image)
+            if img is None:
+                results[i] = (False, "Không thể đọc file ảnh", None)
+                continue
+            is_valid, msg, face = self.detect(img)
+            if not is_valid:
+                results[i] = (False, msg, None)
+                continue
+            faces.append(face)
+            positions.append(i)
+
+        if faces:
+            embeddings = self.embed_batch(faces)
+            for i, embedding in zip(positions, embeddings):
+                results[i] = (True, "Ảnh hợp lệ", embedding)
+
+        return results
@@ -2,16 +2,27 @@
 Face Recognition Attendance System
 Advanced facial recognition for employee attendance tracking
 """
-from deepface import DeepFace
 import cv2
+import hashlib
 import os
+import pickle
+import threading
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 from pathlib import Path
-import pandas as pd
-from typing import Tuple, Optional, Dict
+from typing import Tuple, Optional, Dict, List, Callable
 import config
 from database import Database
+from template_index import TemplateIndex, read_enrollment_batch
+from face_pipeline import ImageInput, decode_image, load_image
+from inference import create_inference
+from cooldown_store import create_cooldown_store
+from photo_writer import PhotoWriter
+from metrics import REGISTRY, stage
+
+RECOGNITION_RESULTS = REGISTRY.counter("recognitions_total", "1:N and 1:1 recognition outcomes", "result")
+ATTENDANCE_RESULTS = REGISTRY.counter("attendance_results_total", "Attendance check outcomes", "result")
 
 class FaceRecognitionSystem:
     def __init__(self):
@@ -19,53 +30,107 @@ class FaceRecognitionSystem:
         connection = self.db.connect()
         if not connection:
             raise Exception("Không thể kết nối đến cơ sở dữ liệu. Vui lòng kiểm tra:\n1. MySQL đã chạy chưa?\n2. Cổng database trong config.py có đúng không?\n3. Thông tin đăng nhập database có chính xác không?")
-        self.last_recognition = {}  # Track last recognition time per employee
+        headcount = self.db.size_employee_cache()
+        if config.EMPLOYEE_CACHE_WARMUP:
+            self.db.warm_employee_cache(headcount)
+        self.cooldowns = create_cooldown_store()  # Employees recognised within COOLDOWN_SECONDS
+        self.photo_writer = PhotoWriter(config.PHOTO_WRITER_WORKERS, config.PHOTO_WRITER_MAX_PENDING)
+        self.inference = create_inference()  # In-process or worker-pool detection and embedding
+        self.index = TemplateIndex()
+        self._ingest_lock = threading.Lock()  # one bulk enrollment merge at a time
+        if self.index.load():
+            self.ingest_enrollments()
+        else:
+            self._build_index()
+            self.index.save()
+            # Photos of pending bulk enrollment batches were just embedded from disk
+            for batch_path in config.ENROLLMENT_INBOX_DIR.glob("*.npz"):
+                batch_path.unlink()
+        self._register_gauges()
         
+    def _register_gauges(self):
+        REGISTRY.gauge("index_employees", "Employees in the recognition index", lambda: len(self.index))
+        REGISTRY.gauge("index_embeddings", "Enrollment photo embeddings kept", lambda: len(self.index.samples))
+        REGISTRY.gauge("employee_cache_size", "Employees in the metadata cache", lambda: len(self.db.employees))
+        REGISTRY.gauge("cooldown_entries", "Employees currently remembered by the cooldown store", lambda: len(self.cooldowns))
+        REGISTRY.gauge("photo_writer_pending", "Attendance photos waiting to be written", lambda: self.photo_writer.pending)
+        REGISTRY.gauge("inference_queue_depth", "Inference calls queued or running (micro-batch queue or worker pool)", self.inference.queue_depth)
+    
     def __del__(self):
         """Cleanup database connection"""
         if hasattr(self, 'db'):
             self.db.disconnect()
     
-    def verify_face_in_image(self, image_path: str) -> Tuple[bool, str]:
+    def _represent(self, image) -> Optional[np.ndarray]:
+        """Compute the face embedding of an enrollment image (best detected face)"""
+        img = load_image(image)
+        if img is None:
+            return None
+        success, _, embedding = self.inference.detect_and_embed(img, enforce_detection=False)
+        return embedding if success else None
+    
+    def _load_legacy_representations(self) -> Dict[str, List[float]]:
+        """Read embeddings already computed by DeepFace.find, keyed by photo path"""
+        pickle_path = config.EMPLOYEE_PHOTOS_DIR / config.LEGACY_REPRESENTATIONS_FILE
+        if not pickle_path.exists():
+            return {}
+        try:
+            with open(pickle_path, 'rb') as f:
+                representations = pickle.load(f)
+            return {
+                str(Path(item['identity']).resolve()): item['embedding']
+                for item in representations
+                if item.get('embedding') is not None
+            }
+        except Exception as e:
+            print(f"Error reading legacy representations: {e}")
+            return {}
+    
+    def _build_index(self):
+        """
+        Embed every employee photo and build the per-employee templates
+        Only needed once, when no persisted index exists yet
+        """
+        legacy = self._load_legacy_representations()
+        embeddings, codes = [], []
+        
+        for photo_path in sorted(config.EMPLOYEE_PHOTOS_DIR.glob("*/*.jpg")):
+            embedding = legacy.get(str(photo_path.resolve()))
+            if embedding is None:
+                try:
+                    embedding = self._represent(str(photo_path))
+                except Exception as e:
+                    print(f"Error embedding {photo_path}: {e}")
+                    continue
+            if embedding is None:
+                continue
+            embeddings.append(embedding)
+            codes.append(photo_path.parent.name)
+        
+        if embeddings:
+            self.index.rebuild(np.vstack(embeddings), codes)
+    
+    def verify_face_in_image(self, image: ImageInput) -> Tuple[bool, str]:
         """
         Verify if image contains a clear face
         Returns: (success, message)
         """
         try:
-            # Detect faces in image
-            faces = DeepFace.extract_faces(
-                img_path=image_path,
-                detector_backend=config.DETECTOR_BACKEND,
-                enforce_detection=True
-            )
-            
-            if len(faces) == 0:
-                return False, "Không phát hiện khuôn mặt trong ảnh"
-            
-            if len(faces) > 1:
-                return False, "Phát hiện nhiều hơn 1 khuôn mặt. Vui lòng chỉ có 1 người trong ảnh"
-            
-            # Check face confidence
-            face = faces[0]
-            if face.get('confidence', 0) < 0.9:
-                return False, "Khuôn mặt không đủ rõ ràng. Vui lòng chụp lại với ánh sáng tốt hơn"
-            
-            # Check image quality
-            img = cv2.imread(image_path)
-            height, width = img.shape[:2]
-            
-            if width < config.PHOTO_QUALITY_MIN_WIDTH or height < config.PHOTO_QUALITY_MIN_HEIGHT:
-                return False, f"Ảnh quá nhỏ. Kích thước tối thiểu: {config.PHOTO_QUALITY_MIN_WIDTH}x{config.PHOTO_QUALITY_MIN_HEIGHT}px"
+            img = load_image(image)
+            if img is None:
+                return False, "Không thể đọc file ảnh"
             
-            return True, "Ảnh hợp lệ"
+            with stage("detect"):
+                return self.inference.verify(img)
             
         except Exception as e:
             return False, f"Lỗi xác thực ảnh: {str(e)}"
     
-    def save_employee_photo(self, employee_code: str, image_path: str) -> Tuple[bool, str, Optional[str]]:
+    def save_employee_photo(self, employee_code: str, image: ImageInput, append: bool = False) -> Tuple[bool, str, Optional[str]]:
         """
         Save employee photo to database directory
-        Overwrites old photo if exists
+        Overwrites old photos unless append=True, which adds one more enrollment
+        photo (up to MAX_ENROLLMENT_PHOTOS, oldest dropped first)
         No validation - accepts any image
         Returns: (success, message, saved_path)
         """
@@ -79,19 +144,27 @@ class FaceRecognitionSystem:
             employee_dir = config.EMPLOYEE_PHOTOS_DIR / employee_code
             employee_dir.mkdir(exist_ok=True)
             
-            # Delete old photos in employee directory to overwrite
-            for old_photo in employee_dir.glob("*.jpg"):
+            if append:
+                # Keep the newest photos so the new one fits within the limit
+                old_photos = sorted(employee_dir.glob("*.jpg"), key=lambda p: p.stat().st_mtime)
+                stale_photos = old_photos[:max(0, len(old_photos) - config.MAX_ENROLLMENT_PHOTOS + 1)]
+                photo_filename = f"{employee_code}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.jpg"
+            else:
+                # Delete old photos in employee directory to overwrite
+                stale_photos = list(employee_dir.glob("*.jpg"))
+                # Save photo with fixed name (no timestamp) to always overwrite
+                photo_filename = f"{employee_code}.jpg"
+            
+            for old_photo in stale_photos:
                 try:
                     old_photo.unlink()
                 except:
                     pass
             
-            # Save photo with fixed name (no timestamp) to always overwrite
-            photo_filename = f"{employee_code}.jpg"
             photo_path = employee_dir / photo_filename
             
             # Copy and optimize image
-            img = cv2.imread(image_path)
+            img = load_image(image)
             if img is None:
                 return False, "Không thể đọc file ảnh", None
                 
@@ -105,6 +178,12 @@ class FaceRecognitionSystem:
             # Save optimized image
             cv2.imwrite(str(photo_path), img, [cv2.IMWRITE_JPEG_QUALITY, 95])
             
+            # Embed only the new photo and recompute this employee's template
+            embedding = self._represent(img)
+            if embedding is not None:
+                self.index.enroll(employee_code, embedding, append=append)
+                self.index.save()
+            
             # Update database with relative path
             relative_path = f"{employee_code}/{photo_filename}"
             self.db.update_employee_face_photo(employee['employee_id'], relative_path)
@@ -114,111 +193,237 @@ class FaceRecognitionSystem:
         except Exception as e:
             return False, f"Lỗi lưu ảnh: {str(e)}", None
     
-    def find_face_in_database(self, image_path: str) -> Tuple[bool, Optional[str], Optional[float], Optional[str]]:
+    def remove_employee_face(self, employee_code: str) -> Tuple[bool, str]:
+        """
+        Remove an employee from the recognition index (e.g. when deactivated)
+        The enrollment photo is kept on disk so it can be re-enrolled later
+        Returns: (success, message)
+        """
+        try:
+            self.db.invalidate_employee(employee_code)
+            if not self.index.remove(employee_code):
+                return False, "Nhân viên chưa có khuôn mặt trong hệ thống nhận diện"
+            self.index.save()
+            return True, "Đã xóa khuôn mặt khỏi hệ thống nhận diện"
+        except Exception as e:
+            return False, f"Lỗi xóa khuôn mặt: {str(e)}"
+    
+    def ingest_enrollments(self) -> Tuple[bool, str]:
+        """
+        Merge bulk enrollment batches written by bulk_enroll.py into the index
+        The service is the only writer of the index files, so nothing it enrolled
+        meanwhile is overwritten and no mapped file is replaced behind its back
+        Returns: (success, message)
+        """
+        try:
+            with self._ingest_lock:
+                return self._ingest_batches()
+        except Exception as e:
+            return False, f"Lỗi nạp lô đăng ký: {str(e)}"
+    
+    def _ingest_batches(self) -> Tuple[bool, str]:
+        batches = sorted(config.ENROLLMENT_INBOX_DIR.glob("*.npz"))
+        if not batches:
+            return True, "Không có lô đăng ký nào chờ xử lý"
+        for batch_path in batches:
+            embeddings, codes, append = read_enrollment_batch(batch_path)
+            if codes:
+                self.index.merge(embeddings, codes, append)
+        self.index.save()
+        for batch_path in batches:
+            batch_path.unlink()
+        # face_photo of the enrolled employees changed along with the index
+        self.db.employees.clear()
+        return True, f"Đã nạp {len(batches)} lô đăng ký ({len(self.index)} nhân viên trong chỉ mục)"
+    
+    def _match_result(self, matches: List[Tuple[str, float]]) -> Tuple[bool, Optional[str], Optional[float], Optional[str]]:
+        """
+        Apply the similarity threshold to the best index match
+        Returns: (found, employee_code, confidence, message)
+        """
+        if not matches:
+            return False, None, None, "Không tìm thấy khuôn mặt khớp"
+        
+        # Get best match
+        employee_code, distance = matches[0]
+        
+        # Check if distance is within threshold
+        if distance > config.SIMILARITY_THRESHOLD:
+            return False, None, None, f"Khuôn mặt không khớp với bất kỳ nhân viên nào (độ tin cậy: {(1-distance)*100:.1f}%)"
+        
+        confidence = 1 - distance  # Convert distance to confidence (0-1)
+        
+        return True, employee_code, confidence, "Nhận diện thành công"
+    
+    def find_face_in_database(self, image: ImageInput) -> Tuple[bool, Optional[str], Optional[float], Optional[str]]:
         """
         Search for matching face in employee database
         Returns: (found, employee_code, confidence, message)
         """
         try:
-            # Verify image has a face
-            is_valid, msg = self.verify_face_in_image(image_path)
+            # Check if index has any employee embeddings
+            if len(self.index) == 0:
+                RECOGNITION_RESULTS.labels("empty_index").inc()
+                return False, None, None, "Chưa có ảnh nhân viên trong hệ thống"
+            
+            # Decode, then detect, check quality and embed in a single pass
+            img = load_image(image)
+            if img is None:
+                RECOGNITION_RESULTS.labels("unreadable").inc()
+                return False, None, None, "Không thể đọc file ảnh"
+            with stage("inference"):
+                is_valid, msg, embedding = self.inference.detect_and_embed(img)
             if not is_valid:
+                RECOGNITION_RESULTS.labels("no_face").inc()
                 return False, None, None, msg
             
-            # Check if database has any photos
-            if not any(config.EMPLOYEE_PHOTOS_DIR.iterdir()):
-                return False, None, None, "Chưa có ảnh nhân viên trong hệ thống"
+            # Search the resident index
+            with stage("search"):
+                matches = self.index.search(embedding, top_k=1)
+            match = self._match_result(matches)
+            RECOGNITION_RESULTS.labels("match" if match[0] else "no_match").inc()
+            return match
             
-            # Search in database
-            results = DeepFace.find(
-                img_path=image_path,
-                db_path=str(config.EMPLOYEE_PHOTOS_DIR),
-                model_name=config.FACE_RECOGNITION_MODEL,
-                detector_backend=config.DETECTOR_BACKEND,
-                distance_metric=config.DISTANCE_METRIC,
-                enforce_detection=False,
-                silent=True
-            )
+        except Exception as e:
+            RECOGNITION_RESULTS.labels("error").inc()
+            return False, None, None, f"Lỗi nhận diện: {str(e)}"
+    
+    def verify_face(self, image: ImageInput, employee_code: str) -> Tuple[bool, Optional[float], str]:
+        """
+        1:1 verification against one known employee, independent of gallery size
+        Returns: (verified, distance, message)
+        """
+        try:
+            if employee_code not in self.index:
+                RECOGNITION_RESULTS.labels("not_enrolled").inc()
+                return False, None, f"Nhân viên {employee_code} chưa đăng ký khuôn mặt"
             
-            # Process results
-            if len(results) > 0 and len(results[0]) > 0:
-                # Get best match
-                best_match = results[0].iloc[0]
-                matched_path = best_match['identity']
-                distance = best_match['distance']
-                
-                # Check if distance is within threshold
-                if distance > config.SIMILARITY_THRESHOLD:
-                    return False, None, None, f"Khuôn mặt không khớp với bất kỳ nhân viên nào (độ tin cậy: {(1-distance)*100:.1f}%)"
-                
-                # Extract employee code from path
-                # Path format: employee_photos/EMPXXX/EMPXXX_timestamp.jpg
-                employee_code = Path(matched_path).parent.name
-                confidence = 1 - distance  # Convert distance to confidence (0-1)
-                
-                return True, employee_code, confidence, "Nhận diện thành công"
+            img = load_image(image)
+            if img is None:
+                RECOGNITION_RESULTS.labels("unreadable").inc()
+                return False, None, "Không thể đọc file ảnh"
+            with stage("inference"):
+                is_valid, msg, embedding = self.inference.detect_and_embed(img)
+            if not is_valid:
+                RECOGNITION_RESULTS.labels("no_face").inc()
+                return False, None, msg
             
-            return False, None, None, "Không tìm thấy khuôn mặt khớp"
+            with stage("search"):
+                distance = self.index.verify(employee_code, embedding)
+            if distance is None:
+                RECOGNITION_RESULTS.labels("not_enrolled").inc()
+                return False, None, f"Nhân viên {employee_code} chưa đăng ký khuôn mặt"
+            
+            if distance > config.SIMILARITY_THRESHOLD:
+                RECOGNITION_RESULTS.labels("no_match").inc()
+                return False, distance, f"❌ Chấm công thất bại!\n\nKhuôn mặt không khớp với tài khoản đăng nhập ({employee_code}).\nĐộ tin cậy: {(1-distance)*100:.1f}%\n\nVui lòng chỉ chấm công cho chính mình!"
+            
+            RECOGNITION_RESULTS.labels("match").inc()
+            return True, distance, "Xác thực thành công"
             
         except Exception as e:
-            error_msg = str(e)
-            if "No item found in" in error_msg:
-                return False, None, None, "Chưa có ảnh nhân viên trong hệ thống. Vui lòng upload ảnh trước"
-            return False, None, None, f"Lỗi nhận diện: {error_msg}"
+            RECOGNITION_RESULTS.labels("error").inc()
+            return False, None, f"Lỗi nhận diện: {str(e)}"
+    
+    def recognize_many(self, images: List[ImageInput]) -> List[Tuple[bool, Optional[str], Optional[float], Optional[str]]]:
+        """
+        Recognize several images at once: detect each, embed all crops in one
+        model batch and search every embedding with one matrix-matrix product
+        Returns: one (found, employee_code, confidence, message) per image, in order
+        """
+        results = [None] * len(images)
+        
+        if len(self.index) == 0:
+            return [(False, None, None, "Chưa có ảnh nhân viên trong hệ thống")] * len(images)
+        
+        # Decode here; detection and one batched forward pass run in the inference backend
+        imgs, positions = [], []
+        for i, image in enumerate(images):
+            img = load_image(image)
+            if img is None:
+                results[i] = (False, None, None, "Không thể đọc file ảnh")
+                continue
+            imgs.append(img)
+            positions.append(i)
+        
+        try:
+            outcomes = self.inference.detect_and_embed_many(imgs)
+        except Exception as e:
+            for i in positions:
+                results[i] = (False, None, None, f"Lỗi nhận diện: {str(e)}")
+            return results
+        
+        embedded, embeddings = [], []
+        for i, (is_valid, msg, embedding) in zip(positions, outcomes):
+            if is_valid:
+                embedded.append(i)
+                embeddings.append(embedding)
+            else:
+                results[i] = (False, None, None, msg)
+        
+        if embeddings:
+            all_matches = self.index.search_many(np.vstack(embeddings), top_k=1)
+            for i, matches in zip(embedded, all_matches):
+                results[i] = self._match_result(matches)
+        
+        return results
     
     def check_cooldown(self, employee_code: str) -> Tuple[bool, str]:
         """
         Check if employee is in cooldown period
         Returns: (can_proceed, message)
         """
-        if employee_code in self.last_recognition:
-            last_time = self.last_recognition[employee_code]
-            time_diff = datetime.now() - last_time
-            
-            if time_diff.total_seconds() < config.COOLDOWN_SECONDS:
-                remaining = config.COOLDOWN_SECONDS - int(time_diff.total_seconds())
-                return False, f"Vui lòng đợi {remaining} giây trước khi thử lại"
+        remaining = self.cooldowns.remaining(employee_code)
+        if remaining > 0:
+            return False, f"Vui lòng đợi {int(remaining) + 1} giây trước khi thử lại"
         
         return True, ""
     
-    def save_attendance_photo(self, employee_code: str, image_path: str, action: str) -> Optional[str]:
+    @staticmethod
+    def attendance_photo_path(employee_code: str, action: str, when: datetime = None) -> str:
+        """Relative path of an attendance photo, known before the photo is written"""
+        timestamp = (when or datetime.now()).strftime("%Y%m%d_%H%M%S")
+        return f"{employee_code}/{employee_code}_{action}_{timestamp}.jpg"
+    
+    def save_attendance_photo(self, employee_code: str, image: ImageInput, action: str, when: datetime = None,
+                              on_failure: Callable[[], None] = None) -> Optional[str]:
         """
         Save attendance check-in/check-out photo
+        The photo is resized, encoded and written in the background (PhotoWriter);
+        the path is returned as soon as it is queued, and on_failure is called if
+        the background write then fails
         Returns: relative path to saved photo or None
         """
         try:
-            # Create attendance_photos directory
-            attendance_dir = config.EMPLOYEE_PHOTOS_DIR.parent / "attendance_photos" / employee_code
-            attendance_dir.mkdir(parents=True, exist_ok=True)
-            
             # Generate filename with timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            photo_filename = f"{employee_code}_{action}_{timestamp}.jpg"
-            photo_path = attendance_dir / photo_filename
+            relative_path = self.attendance_photo_path(employee_code, action, when)
+            photo_path = config.ATTENDANCE_PHOTOS_DIR / relative_path
             
-            # Load and resize image
-            img = cv2.imread(image_path)
+            img = load_image(image)
             if img is None:
                 return None
             
-            # Resize to smaller size (max 400px width for attendance photos)
-            height, width = img.shape[:2]
-            if width > 400:
-                ratio = 400 / width
-                new_size = (400, int(height * ratio))
-                img = cv2.resize(img, new_size)
-            
-            # Save resized image
-            cv2.imwrite(str(photo_path), img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            # Resize to smaller size (max 400px width for attendance photos) and save, off the request path
+            if not self.photo_writer.submit(photo_path, img, max_width=400, quality=85, on_failure=on_failure):
+                return None
             
             # Return relative path
-            return f"{employee_code}/{photo_filename}"
+            return relative_path
             
         except Exception as e:
             print(f"Error saving attendance photo: {e}")
             return None
     
-    def process_attendance(self, image_path: str, expected_employee_code: str = None) -> Dict:
+    def _save_recorded_photo(self, employee_code: str, img: np.ndarray, action: str, when: datetime,
+                             attendance_id: int, column: str, photo_path: str):
+        """Save the photo whose path record_attendance already stored; unset that path if it is never written"""
+        def clear():
+            self.db.clear_attendance_photo(attendance_id, column, photo_path)
+        
+        if self.save_attendance_photo(employee_code, img, action, when, on_failure=clear) is None:
+            clear()
+    
+    def process_attendance(self, image: ImageInput, expected_employee_code: str = None) -> Dict:
         """
         Process attendance check-in/out from image
         If expected_employee_code is provided, only allow that employee to check in/out
@@ -231,34 +436,69 @@ class FaceRecognitionSystem:
             'attendance': None,
             'action': None,  # 'check_in' or 'check_out'
             'confidence': None,
+            'distance': None,
+            'verified': None,  # 1:1 verification decision when expected_employee_code is given
             'recognized_employee': None  # Employee code from face recognition
         }
         
         try:
-            # Find face in database
-            found, employee_code, confidence, msg = self.find_face_in_database(image_path)
-            
-            if not found:
-                result['message'] = msg
-                return result
-            
-            result['confidence'] = confidence
-            result['recognized_employee'] = employee_code
-            
-            # If expected_employee_code is provided, verify it matches
-            if expected_employee_code and employee_code != expected_employee_code:
-                result['message'] = f"❌ Chấm công thất bại!\n\nKhuôn mặt không khớp với tài khoản đăng nhập.\n\nNhận diện: {employee_code}\nTài khoản: {expected_employee_code}\n\nVui lòng chỉ chấm công cho chính mình!"
+            # Decode once; recognition and the attendance photo share the frame. Uploads arrive
+            # already decoded (timed in decode_image), so only a file path is timed here
+            if isinstance(image, np.ndarray):
+                img = image
+            else:
+                with stage("decode"):
+                    img = load_image(image)
+            if img is None:
+                ATTENDANCE_RESULTS.labels("unreadable").inc()
+                result['message'] = "Không thể đọc file ảnh"
                 return result
             
-            # Check cooldown
-            can_proceed, cooldown_msg = self.check_cooldown(employee_code)
-            if not can_proceed:
-                result['message'] = cooldown_msg
-                return result
+            if expected_employee_code:
+                # The employee is known up front, so a cooldown is answered without running the model
+                can_proceed, cooldown_msg = self.check_cooldown(expected_employee_code)
+                if not can_proceed:
+                    ATTENDANCE_RESULTS.labels("cooldown").inc()
+                    result['message'] = cooldown_msg
+                    return result
+                
+                # Known account: 1:1 verification against that employee only
+                verified, distance, msg = self.verify_face(img, expected_employee_code)
+                result['verified'] = verified
+                result['distance'] = distance
+                if distance is not None:
+                    result['confidence'] = 1 - distance
+                if not verified:
+                    ATTENDANCE_RESULTS.labels("rejected").inc()
+                    result['message'] = msg
+                    return result
+                employee_code = expected_employee_code
+                confidence = 1 - distance
+                result['recognized_employee'] = employee_code
+            else:
+                # Find face in database
+                found, employee_code, confidence, msg = self.find_face_in_database(img)
+                
+                if not found:
+                    ATTENDANCE_RESULTS.labels("rejected").inc()
+                    result['message'] = msg
+                    return result
+                
+                result['confidence'] = confidence
+                result['distance'] = 1 - confidence
+                result['recognized_employee'] = employee_code
+                
+                # Check cooldown
+                can_proceed, cooldown_msg = self.check_cooldown(employee_code)
+                if not can_proceed:
+                    ATTENDANCE_RESULTS.labels("cooldown").inc()
+                    result['message'] = cooldown_msg
+                    return result
             
             # Get employee info
             employee = self.db.get_employee_by_code(employee_code)
             if not employee:
+                ATTENDANCE_RESULTS.labels("unknown_employee").inc()
                 result['message'] = f"Không tìm thấy thông tin nhân viên {employee_code}"
                 return result
             
@@ -270,64 +510,63 @@ class FaceRecognitionSystem:
                 'position': employee.get('position_name')
             }
             
-            # Check today's attendance
-            today_attendance = self.db.get_today_attendance(employee['employee_id'])
+            # Check in or out in one upsert; photo paths are known up front so the
+            # row and the decision are written atomically, then only the used photo is saved.
+            # A photo that is dropped or fails to write has its path cleared again
+            now = datetime.now()
+            check_in_photo = self.attendance_photo_path(employee_code, "checkin", now)
+            check_out_photo = self.attendance_photo_path(employee_code, "checkout", now)
+            action, attendance = self.db.record_attendance(
+                employee['employee_id'], check_in_photo, check_out_photo, now
+            )
             
-            if not today_attendance:
-                # Check in
-                # Save check-in photo
-                photo_path = self.save_attendance_photo(employee_code, image_path, "checkin")
+            if action == 'check_in':
+                with stage("photo"):
+                    self._save_recorded_photo(employee_code, img, "checkin", now, attendance['attendance_id'],
+                                              'check_in_photo', check_in_photo)
+                result['success'] = True
+                result['action'] = 'check_in'
+                result['message'] = f"Chấm công VÀO thành công!\nNhân viên: {employee['full_name']}\nMã NV: {employee_code}\nĐộ tin cậy: {confidence*100:.1f}%"
+                result['attendance'] = {'attendance_id': attendance['attendance_id']}
                 
-                attendance_id = self.db.create_attendance_record(employee['employee_id'], photo_path)
-                if attendance_id:
-                    result['success'] = True
-                    result['action'] = 'check_in'
-                    result['message'] = f"Chấm công VÀO thành công!\nNhân viên: {employee['full_name']}\nMã NV: {employee_code}\nĐộ tin cậy: {confidence*100:.1f}%"
-                    result['attendance'] = {'attendance_id': attendance_id}
-                    
-                    # Update last recognition time
-                    self.last_recognition[employee_code] = datetime.now()
-                else:
-                    result['message'] = "Lỗi tạo bản ghi chấm công"
-            
-            elif not today_attendance.get('check_out'):
-                # Check out
-                # Save check-out photo
-                photo_path = self.save_attendance_photo(employee_code, image_path, "checkout")
+                # Update last recognition time
+                self.cooldowns.touch(employee_code)
+            
+            elif action == 'check_out':
+                with stage("photo"):
+                    self._save_recorded_photo(employee_code, img, "checkout", now, attendance['attendance_id'],
+                                              'check_out_photo', check_out_photo)
+                actual_hours = float(attendance.get('actual_hours') or 0)
+                result['success'] = True
+                result['action'] = 'check_out'
+                result['message'] = f"Chấm công RA thành công!\nNhân viên: {employee['full_name']}\nGiờ làm: {actual_hours:.1f}h"
+                result['attendance'] = {
+                    'attendance_id': attendance['attendance_id'],
+                    'actual_hours': actual_hours
+                }
                 
-                attendance_id = self.db.update_checkout_time(today_attendance['attendance_id'], photo_path)
-                if attendance_id:
-                    result['success'] = True
-                    result['action'] = 'check_out'
-                    
-                    # Get updated attendance info
-                    updated_attendance = self.db.fetch_one(
-                        "SELECT * FROM attendance WHERE attendance_id = %s",
-                        (attendance_id,)
-                    )
-                    
-                    result['message'] = f"Chấm công RA thành công!\nNhân viên: {employee['full_name']}\nGiờ làm: {updated_attendance.get('actual_hours', 0):.1f}h"
-                    result['attendance'] = {
-                        'attendance_id': attendance_id,
-                        'actual_hours': float(updated_attendance.get('actual_hours', 0))
-                    }
-                    
-                    # Update last recognition time
-                    self.last_recognition[employee_code] = datetime.now()
-                else:
-                    result['message'] = "Lỗi cập nhật giờ ra"
+                # Update last recognition time
+                self.cooldowns.touch(employee_code)
             
-            else:
+            elif action == 'cooldown':
+                result['message'] = f"Nhân viên {employee['full_name']} vừa chấm công VÀO. Vui lòng đợi {config.COOLDOWN_SECONDS} giây trước khi chấm công RA"
+            
+            elif action == 'complete':
                 result['message'] = f"Nhân viên {employee['full_name']} đã chấm công đủ hôm nay"
             
+            else:
+                result['message'] = "Lỗi ghi bản ghi chấm công"
+            
+            ATTENDANCE_RESULTS.labels(action or "error").inc()
             return result
             
         except Exception as e:
+            ATTENDANCE_RESULTS.labels("error").inc()
             result['message'] = f"Lỗi xử lý: {str(e)}"
             return result
     
     def get_attendance_stats(self, employee_code: str, month: int = None, year: int = None) -> Dict:
-        """Get attendance statistics for employee"""
+        """Get attendance statistics for employee (read from attendance_monthly_summary)"""
         employee = self.db.get_employee_by_code(employee_code)
         if not employee:
             return None
@@ -336,47 +575,117 @@ class FaceRecognitionSystem:
         month = month or now.month
         year = year or now.year
         
-        query = """
-            SELECT 
-                COUNT(*) as total_days,
-                SUM(CASE WHEN status = 'present' THEN 1 ELSE 0 END) as present_days,
-                SUM(CASE WHEN status = 'late' THEN 1 ELSE 0 END) as late_days,
-                SUM(CASE WHEN status = 'absent' THEN 1 ELSE 0 END) as absent_days,
-                SUM(actual_hours) as total_hours,
-                SUM(overtime_hours) as total_overtime
-            FROM attendance
-            WHERE employee_id = %s 
-            AND MONTH(attendance_date) = %s 
-            AND YEAR(attendance_date) = %s
-        """
-        
-        stats = self.db.fetch_one(query, (employee['employee_id'], month, year))
+        stats = self.db.get_monthly_summary(employee['employee_id'], year, month)
+        if stats is None:
+            # No attendance that month: same shape as aggregating zero rows
+            stats = {
+                'total_days': 0,
+                'present_days': None,
+                'late_days': None,
+                'absent_days': None,
+                'total_hours': None,
+                'total_overtime': None
+            }
         return stats
     
-    def save_temp_image(self, image_data) -> str:
-        """Save temporary image from upload"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        temp_path = config.TEMP_DIR / f"temp_{timestamp}.jpg"
-        
-        if isinstance(image_data, str):
-            # If base64 string
-            import base64
-            img_data = base64.b64decode(image_data.split(',')[1] if ',' in image_data else image_data)
-            with open(temp_path, 'wb') as f:
-                f.write(img_data)
-        else:
-            # If file object
-            image_data.save(str(temp_path))
-        
-        return str(temp_path)
+    STATS_COLUMNS = (
+        'employee_id', 'employee_code', 'full_name', 'department_id', 'total_days',
+        'present_days', 'late_days', 'absent_days', 'total_hours', 'total_overtime'
+    )
+    
+    def get_bulk_attendance_stats(self, start: date, end: date, department_id: int = None,
+                                  statuses: List[str] = None) -> Dict:
+        """
+        Attendance statistics of many employees over [start, end), as columns:
+        one list per field, the i-th entry of each belonging to the same employee
+        """
+        rows = self.db.get_bulk_attendance_stats(start, end, department_id, statuses)
+        columns = {name: [] for name in self.STATS_COLUMNS}
+        for row in rows:
+            for name in self.STATS_COLUMNS:
+                value = row[name]
+                columns[name].append(float(value) if isinstance(value, Decimal) else value)
+        return {
+            'from': start.isoformat(),
+            'to': (end - timedelta(days=1)).isoformat(),
+            'count': len(rows),
+            'columns': columns
+        }
+    
+    def attendance_stats_etag(self, start: date, end: date, department_id: int = None,
+                              statuses: List[str] = None) -> Optional[str]:
+        """ETag of get_bulk_attendance_stats() for these filters, from the database change marker"""
+        marker = self.db.get_attendance_stats_marker(start, end, statuses)
+        if marker is None:
+            return None
+        return self._etag(start, end, department_id, sorted(statuses or []), sorted(marker.items()))
+    
+    def employees_with_photos_etag(self, after_id: int, limit: int, fields: List[str]) -> Optional[str]:
+        """ETag of one page of the employees-with-photos listing"""
+        marker = self.db.get_employees_with_photos_marker()
+        if marker is None:
+            return None
+        return self._etag(after_id, limit, list(fields), sorted(marker.items()))
+    
+    @staticmethod
+    def _etag(*parts) -> str:
+        return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+    
+    def decode_image(self, image_data) -> Optional[np.ndarray]:
+        """Decode an upload (file object, raw bytes or base64 string) in memory"""
+        with stage("decode"):
+            return decode_image(image_data)
     
-    def cleanup_temp_files(self, max_age_hours: int = 24):
-        """Clean up old temporary files"""
+    def cleanup_temp_files(self, max_age_hours: int = None) -> int:
+        """Clean up old temporary files. Returns the number deleted"""
+        if max_age_hours is None:
+            max_age_hours = config.TEMP_FILE_MAX_AGE_HOURS
+        removed = 0
         try:
             now = datetime.now()
             for temp_file in config.TEMP_DIR.glob("temp_*.jpg"):
                 file_time = datetime.fromtimestamp(temp_file.stat().st_mtime)
                 if (now - file_time).total_seconds() > max_age_hours * 3600:
                     temp_file.unlink()
+                    removed += 1
         except Exception as e:
             print(f"Error cleaning temp files: {e}")
+        return removed
+    
+    def rotate_logs(self) -> Dict:
+        """
+        Rotate *.log files in LOGS_DIR larger than LOG_MAX_BYTES (renamed with a timestamp)
+        and delete rotated files older than LOG_RETENTION_DAYS
+        """
+        rotated, deleted = 0, 0
+        now = datetime.now()
+        for log_file in config.LOGS_DIR.glob("*.log"):
+            if log_file.stat().st_size > config.LOG_MAX_BYTES:
+                log_file.rename(log_file.with_name(f"{log_file.name}.{now.strftime('%Y%m%d_%H%M%S')}"))
+                rotated += 1
+        for old_file in config.LOGS_DIR.glob("*.log.*"):
+            file_time = datetime.fromtimestamp(old_file.stat().st_mtime)
+            if (now - file_time).days >= config.LOG_RETENTION_DAYS:
+                old_file.unlink()
+                deleted += 1
+        return {'rotated': rotated, 'deleted': deleted}
+    
+    def prune_caches(self) -> Dict:
+        """Drop expired cooldowns and employee cache entries"""
+        return {
+            'cooldowns': self.cooldowns.prune(),
+            'employees': self.db.employees.prune()
+        }
+    
+    def compact_index(self) -> bool:
+        """Refit the IVF clusters once enough enrollments have changed the gallery"""
+        return self.index.retrain(config.INDEX_RETRAIN_MIN_CHANGES)
+    
+    def maintenance_tasks(self) -> List[Tuple[str, Callable]]:
+        """Periodic housekeeping run by the background janitor"""
+        return [
+            ('cleanup_temp_files', self.cleanup_temp_files),
+            ('rotate_logs', self.rotate_logs),
+            ('prune_caches', self.prune_caches),
+            ('compact_index', self.compact_index),
+        ]
@@ -0,0 +1,142 @@
+"""
+Inference backends for face detection and embedding
+LocalInference runs the pipeline inside the web process; InferencePool runs
+it in worker processes that each load the model once, so detection and
+embedding use every core instead of sharing one GIL and one TF session.
+Both expose the same methods, and FaceRecognitionSystem does not care which
+one it is given.
+"""
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Tuple, Optional, Dict, List
+import numpy as np
+import config
+from face_pipeline import FacePipeline
+from inference_scheduler import MicroBatchScheduler
+
+
+class LocalInference:
+    def __init__(self):
+        self.pipeline = FacePipeline()
+        self.scheduler = None
+        if config.MICRO_BATCHING_ENABLED:
+            self.scheduler = MicroBatchScheduler(
+                self.pipeline.embed_batch,
+                window_ms=config.MICRO_BATCH_WINDOW_MS,
+                max_batch_size=config.MICRO_BATCH_MAX_SIZE
+            )
+
+    def verify(self, img: np.ndarray) -> Tuple[bool, str]:
+        """Run detection and the quality checks only"""
+        is_valid, msg, _ = self.pipeline.detect(img)
+        return is_valid, msg
+
+    def detect_and_embed(self, img: np.ndarray, enforce_detection: bool = True) -> Tuple[bool, str, Optional[np.ndarray]]:
+        """Detect once and embed the crop (micro-batched with concurrent requests when enabled)"""
+        is_valid, msg, face = self.pipeline.detect(img, enforce_detection)
+        if not is_valid:
+            return False, msg, None
+        if self.scheduler:
+            return True, msg, self.scheduler.embed(face)
+        return True, msg, self.pipeline.embed(face)
+
+    def detect_and_embed_many(self, images: List[np.ndarray]) -> List[Tuple[bool, str, Optional[np.ndarray]]]:
+        """Detect each image and embed all crops in one forward pass"""
+        return self.pipeline.process_many(images)
+
+    def queue_depth(self) -> int:
+        """Faces waiting for the micro-batch scheduler"""
+        return self.scheduler.queue_depth() if self.scheduler else 0
+
+    def stats(self) -> Dict:
+        stats = {'backend': 'local', 'workers': 0}
+        if self.scheduler:
+            stats['micro_batching'] = self.scheduler.stats()
+        return stats
+
+
+# Worker-process side: one pipeline (and model) per worker, built by the initializer
+_worker_pipeline = None
+
+
+def _init_worker():
+    global _worker_pipeline
+    _worker_pipeline = FacePipeline()
+
+
+def _worker_verify(img: np.ndarray) -> Tuple[bool, str]:
+    is_valid, msg, _ = _worker_pipeline.detect(img)
+    return is_valid, msg
+
+
+def _worker_detect_and_embed(img: np.ndarray, enforce_detection: bool) -> Tuple[bool, str, Optional[np.ndarray]]:
+    return _worker_pipeline.process(img, enforce_detection)
+
+
+def _worker_detect_and_embed_many(images: List[np.ndarray]) -> List[Tuple[bool, str, Optional[np.ndarray]]]:
+    return _worker_pipeline.process_many(images)
+
+
+class InferencePool:
+    def __init__(self, workers: int):
+        self.workers = workers
+        # spawn, not fork: TensorFlow state must not be inherited from the web process
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    def _submit(self, fn, *args) -> Future:
+        """Submit to the workers, counting calls until they finish"""
+        with self._in_flight_lock:
+            self._in_flight += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, _future):
+        with self._in_flight_lock:
+            self._in_flight -= 1
+
+    def verify(self, img: np.ndarray) -> Tuple[bool, str]:
+        return self._submit(_worker_verify, img).result()
+
+    def detect_and_embed(self, img: np.ndarray, enforce_detection: bool = True) -> Tuple[bool, str, Optional[np.ndarray]]:
+        return self._submit(_worker_detect_and_embed, img, enforce_detection).result()
+
+    def detect_and_embed_many(self, images: List[np.ndarray]) -> List[Tuple[bool, str, Optional[np.ndarray]]]:
+        """Split the images into one chunk per worker; each chunk is embedded as one batch"""
+        if not images:
+            return []
+        chunk_size = -(-len(images) // self.workers)
+        futures = [
+            self._submit(_worker_detect_and_embed_many, images[start:start + chunk_size])
+            for start in range(0, len(images), chunk_size)
+        ]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def queue_depth(self) -> int:
+        """Calls submitted to the worker processes and not finished yet"""
+        return self._in_flight
+
+    def stats(self) -> Dict:
+        return {'backend': 'process_pool', 'workers': self.workers}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def create_inference():
+    """Pick the inference backend configured in config.INFERENCE_WORKERS"""
+    if config.INFERENCE_WORKERS > 0:
+        return InferencePool(config.INFERENCE_WORKERS)
+    return LocalInference()
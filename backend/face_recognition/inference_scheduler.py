@@ -0,0 +1,80 @@
+"""
+Dynamic micro-batching for concurrent embedding requests
+Request threads submit detected faces; a single scheduler thread collects
+them for a short window (or until the batch is full), runs one forward
+pass and hands every caller its own embedding
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+import numpy as np
+from metrics import Histogram
+
+
+class MicroBatchScheduler:
+    def __init__(self, embed_batch: Callable[[List[Dict]], np.ndarray], window_ms: float, max_batch_size: int):
+        self.embed_batch = embed_batch
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64])
+        self.queue_depths = Histogram([0, 1, 2, 4, 8, 16, 32, 64, 128])
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, face: Dict) -> Future:
+        """Queue one detected face; the future resolves to its embedding"""
+        future = Future()
+        self.queue_depths.observe(self._queue.qsize())
+        self._queue.put((face, future))
+        return future
+
+    def embed(self, face: Dict) -> np.ndarray:
+        """Submit one face and wait for its embedding"""
+        return self.submit(face).result()
+
+    def _collect(self) -> List:
+        """Block for the first request, then gather more until the window closes or the batch is full"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        # The only scheduler thread: nothing may escape this loop, or every later submit waits forever
+        while True:
+            batch = self._collect()
+            self.batch_sizes.observe(len(batch))
+            faces = [face for face, _ in batch]
+            try:
+                embeddings = self.embed_batch(faces)
+                if len(embeddings) != len(batch):
+                    raise RuntimeError(f"Mô hình trả về {len(embeddings)} embedding cho {len(batch)} khuôn mặt")
+                for (_, future), embedding in zip(batch, embeddings):
+                    if not future.done():
+                        future.set_result(embedding)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict:
+        return {
+            'window_ms': self.window * 1000.0,
+            'max_batch_size': self.max_batch_size,
+            'queue_depth': self.queue_depth(),
+            'batch_size': self.batch_sizes.snapshot(),
+            'queue_depth_on_submit': self.queue_depths.snapshot(),
+        }
@@ -0,0 +1,75 @@
+"""
+Background maintenance ("janitor") thread
+Periodic housekeeping (temp files, log rotation, cooldown pruning, index
+compaction) runs on one daemon thread at a fixed interval instead of on the
+request path. Each task is timed and its last result or error is kept for
+/api/maintenance/stats.
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+from metrics import Histogram
+
+
+class Janitor:
+    def __init__(self, interval_seconds: float, tasks: List[Tuple[str, Callable]]):
+        self.interval = interval_seconds
+        self.tasks = list(tasks)
+        self.runs = 0
+        self.last_run_at = None
+        self.durations = Histogram([0.001, 0.01, 0.1, 1, 10, 60])
+        self._task_stats = {
+            name: {'runs': 0, 'last_duration_ms': None, 'last_result': None, 'last_error': None, 'errors': 0}
+            for name, _ in self.tasks
+        }
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def run_once(self) -> Dict:
+        """Run every task once, in order; one failing task does not stop the others"""
+        started = time.perf_counter()
+        for name, task in self.tasks:
+            task_started = time.perf_counter()
+            try:
+                result, error = task(), None
+            except Exception as e:
+                result, error = None, str(e)
+                print(f"Maintenance task {name} failed: {e}")
+            elapsed_ms = (time.perf_counter() - task_started) * 1000.0
+            with self._lock:
+                stats = self._task_stats[name]
+                stats['runs'] += 1
+                stats['last_duration_ms'] = round(elapsed_ms, 3)
+                stats['last_result'] = result
+                stats['last_error'] = error
+                stats['errors'] += error is not None
+        self.durations.observe(time.perf_counter() - started)
+        with self._lock:
+            self.runs += 1
+            self.last_run_at = time.time()
+        return self.stats()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'interval_seconds': self.interval,
+                'runs': self.runs,
+                'last_run_at': self.last_run_at,
+                'run_duration_seconds': self.durations.snapshot(),
+                'tasks': {name: dict(stats) for name, stats in self._task_stats.items()},
+            }
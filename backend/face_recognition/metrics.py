@@ -0,0 +1,195 @@
+"""
+Lightweight process metrics rendered in the Prometheus text format
+Counters, histograms and callback gauges live in one module-level REGISTRY.
+stage() times one step of a request (decode, inference, search, db...) into
+the stage_duration_seconds histogram and also records it for the current
+request, so app.py can return a Server-Timing header.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+# Seconds; spans sub-millisecond searches up to slow CPU inference
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+class Histogram:
+    """Cumulative bucket histogram (count of observations <= bucket bound)"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'buckets': {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+                'count': self.count,
+                'sum': self.sum,
+            }
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        with self._lock:
+            lines = [
+                f'{name}_bucket{{{_join(labels, _le(bound))}}} {count}'
+                for bound, count in zip(self.buckets, self.counts)
+            ]
+            lines.append(f'{name}_bucket{{{_join(labels, _le("+Inf"))}}} {self.count}')
+            lines.append(f'{name}_sum{_braces(labels)} {self.sum}')
+            lines.append(f'{name}_count{_braces(labels)} {self.count}')
+        return lines
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        return [f'{name}{_braces(labels)} {self.value}']
+
+
+def _join(*parts: str) -> str:
+    return ",".join(part for part in parts if part)
+
+
+def _le(bound) -> str:
+    return 'le="%s"' % bound
+
+
+def _braces(labels: str) -> str:
+    return f"{{{labels}}}" if labels else ""
+
+
+class MetricFamily:
+    """One metric name with a child Counter/Histogram per label combination"""
+
+    def __init__(self, name: str, help_text: str, kind: str, label_names: Tuple[str, ...], factory: Callable):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.label_names = label_names
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            labels = ",".join(f'{key}="{value}"' for key, value in zip(self.label_names, values))
+            lines.extend(child.samples(self.name, labels))
+        return lines
+
+
+class GaugeCallback:
+    """Gauge whose value is read from a callback at scrape time"""
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help_text
+        self.read = read
+
+    def render(self) -> List[str]:
+        try:
+            value = float(self.read())
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class MetricsRegistry:
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, name: str, create: Callable):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = create(f"{self.prefix}_{name}")
+            return metric
+
+    def counter(self, name: str, help_text: str, *label_names: str) -> MetricFamily:
+        return self._register(name, lambda full: MetricFamily(full, help_text, "counter", label_names, Counter))
+
+    def histogram(self, name: str, help_text: str, *label_names: str, buckets: List[float] = None) -> MetricFamily:
+        buckets = buckets or LATENCY_BUCKETS
+        return self._register(
+            name, lambda full: MetricFamily(full, help_text, "histogram", label_names, lambda: Histogram(buckets))
+        )
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]) -> GaugeCallback:
+        """(Re)bind a gauge to the callback that reads its current value"""
+        with self._lock:
+            gauge = self._metrics[name] = GaugeCallback(f"{self.prefix}_{name}", help_text, read)
+        return gauge
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry("face_recognition")
+
+STAGE_SECONDS = REGISTRY.histogram("stage_duration_seconds", "Time spent per processing stage", "stage")
+
+_request = threading.local()
+
+
+def begin_request():
+    """Start collecting stage timings for the current thread's request"""
+    _request.timings = {}
+
+
+def request_timings() -> Dict[str, float]:
+    """Total milliseconds per stage recorded since begin_request()"""
+    return getattr(_request, 'timings', None) or {}
+
+
+def observe_stage(name: str, seconds: float):
+    STAGE_SECONDS.labels(name).observe(seconds)
+    timings = getattr(_request, 'timings', None)
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds * 1000.0
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as processing stage `name`"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started)
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={ms:.2f}" for name, ms in timings.items())
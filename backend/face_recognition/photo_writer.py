@@ -0,0 +1,110 @@
+"""
+Write-behind storage for attendance evidence photos
+The request thread hands over the already decoded frame and gets the path
+back at once; resizing, JPEG encoding and the file write happen on a small
+thread pool (OpenCV releases the GIL while it works). The number of pending
+photos is bounded: when the writers fall behind, new photos are dropped and
+counted rather than queued without limit. A write that fails is reported
+through the caller's on_failure callback. Pending photos are flushed at exit.
+"""
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional
+import cv2
+import numpy as np
+from metrics import REGISTRY
+
+PHOTO_WRITES = REGISTRY.counter("photo_writes_total", "Attendance photos by outcome (written, dropped, failed)", "result")
+for _result in ("written", "dropped", "failed"):
+    PHOTO_WRITES.labels(_result)  # exported from 0, so alerts see the series before the first drop
+
+
+class PhotoWriter:
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="photo-writer")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self.pending = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        atexit.register(self.shutdown)
+
+    def submit(self, path: Path, img: np.ndarray, max_width: int, quality: int,
+               on_failure: Optional[Callable[[], None]] = None) -> bool:
+        """
+        Queue one photo for writing (resized to max_width, JPEG at quality)
+        on_failure is called from the writer thread if the write fails
+        Returns False if it was dropped because too many photos are pending
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.dropped += 1
+            PHOTO_WRITES.labels("dropped").inc()
+            return False
+        with self._lock:
+            self.pending += 1
+        try:
+            self._executor.submit(self._write, Path(path), img, max_width, quality, on_failure)
+        except RuntimeError:
+            # Executor already shut down (interpreter exiting)
+            self._done(written=False)
+            return False
+        return True
+
+    def _write(self, path: Path, img: np.ndarray, max_width: int, quality: int,
+               on_failure: Optional[Callable[[], None]]):
+        written = False
+        try:
+            height, width = img.shape[:2]
+            if width > max_width:
+                ratio = max_width / width
+                img = cv2.resize(img, (max_width, int(height * ratio)))
+            path.parent.mkdir(parents=True, exist_ok=True)
+            written = cv2.imwrite(str(path), img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        except Exception as e:
+            print(f"Error saving attendance photo: {e}")
+        finally:
+            self._done(written)
+        if not written and on_failure is not None:
+            try:
+                on_failure()
+            except Exception as e:
+                print(f"Error handling failed attendance photo: {e}")
+
+    def _done(self, written: bool):
+        with self._lock:
+            self.pending -= 1
+            if written:
+                self.written += 1
+            else:
+                self.failed += 1
+            if self.pending == 0:
+                self._idle.notify_all()
+        PHOTO_WRITES.labels("written" if written else "failed").inc()
+        self._slots.release()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every queued photo is written. Returns False on timeout"""
+        with self._lock:
+            return self._idle.wait_for(lambda: self.pending == 0, timeout)
+
+    def shutdown(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+            }
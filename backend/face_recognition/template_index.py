@@ -0,0 +1,180 @@
+"""
+Per-employee face templates built from several enrollment photos
+Each employee is searched through one mean embedding, so search cost grows
+with the number of employees, not photos. The best candidates are then
+rescored against a few medoid embeddings that keep the variation (lighting,
+pose) between photos. The raw per-photo samples are kept only so templates
+can be recomputed when a photo is added.
+"""
+import os
+import threading
+import numpy as np
+from pathlib import Path
+from typing import List, Tuple, Optional
+import config
+from embedding_index import EmbeddingIndex
+
+
+def build_template(samples: np.ndarray, n_medoids: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Aggregate L2-normalised photo embeddings into (mean, medoids)
+    Medoids are picked greedily to minimise the total cosine distance of all samples
+    """
+    mean = EmbeddingIndex.normalize(samples.mean(axis=0))
+    if len(samples) <= n_medoids:
+        return mean, samples
+
+    distances = 1.0 - samples @ samples.T
+    chosen = []
+    closest = np.full(len(samples), np.inf)
+    for _ in range(n_medoids):
+        # Total distance of every sample to its nearest medoid if candidate j were added
+        costs = np.minimum(closest[None, :], distances).sum(axis=1)
+        costs[chosen] = np.inf
+        best = int(np.argmin(costs))
+        chosen.append(best)
+        closest = np.minimum(closest, distances[best])
+    return mean, samples[chosen]
+
+
+class TemplateIndex:
+    def __init__(self):
+        self.means = EmbeddingIndex()  # one row per employee, searched 1:N (exact or IVF)
+        self.medoids = EmbeddingIndex(mode="exact")  # few rows per employee, used for rescoring
+        self.samples = EmbeddingIndex(mode="exact")  # one row per enrollment photo
+        self._lock = threading.RLock()  # keeps the three stores consistent during updates
+
+    def __len__(self):
+        return len(self.means)
+
+    def __contains__(self, employee_code: str) -> bool:
+        return employee_code in self.means
+
+    def load(self) -> bool:
+        """Memory-map the persisted stores. Returns False if there is nothing to load"""
+        if not self.means.load_file(config.EMBEDDING_INDEX_PATH):
+            return False
+        if not self.samples.load_file(config.TEMPLATE_SAMPLES_PATH):
+            # Index written before multi-photo enrollment: every row is a single-photo template
+            self.rebuild(self.means.embeddings, self.means.codes.tolist())
+            self.save()
+            return True
+        if not self.medoids.load_file(config.TEMPLATE_MEDOIDS_PATH):
+            self.rebuild(self.samples.embeddings, self.samples.codes.tolist())
+            self.save()
+        return True
+
+    def save(self):
+        """Persist samples first, templates last, each store atomically"""
+        with self._lock:
+            self.samples.save(config.TEMPLATE_SAMPLES_PATH)
+            self.medoids.save(config.TEMPLATE_MEDOIDS_PATH)
+            self.means.save(config.EMBEDDING_INDEX_PATH)
+
+    def rebuild(self, embeddings: np.ndarray, codes: List[str]):
+        """Recompute every template from all photo embeddings"""
+        embeddings = EmbeddingIndex.normalize(np.atleast_2d(embeddings))
+        rows_by_code = {}
+        for i, code in enumerate(codes):
+            rows_by_code.setdefault(code, []).append(i)
+
+        sample_rows, means, mean_codes, medoids, medoid_codes = [], [], [], [], []
+        for code, rows in rows_by_code.items():
+            rows = rows[-config.MAX_ENROLLMENT_PHOTOS:]
+            mean, code_medoids = build_template(embeddings[rows], config.TEMPLATE_MEDOIDS)
+            sample_rows.extend(rows)
+            means.append(mean)
+            mean_codes.append(code)
+            medoids.append(code_medoids)
+            medoid_codes.extend([code] * len(code_medoids))
+
+        empty = np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+        with self._lock:
+            self.samples.load(embeddings[sample_rows] if sample_rows else empty, [codes[i] for i in sample_rows])
+            self.means.load(np.vstack(means) if means else empty, mean_codes)
+            self.medoids.load(np.vstack(medoids) if medoids else empty, medoid_codes)
+
+    def enroll(self, employee_code: str, embedding, append: bool = False):
+        """
+        Add (append=True) or replace the photo embeddings of one employee
+        and recompute only that employee's template
+        """
+        new = EmbeddingIndex.normalize(np.atleast_2d(np.asarray(embedding)))
+        with self._lock:
+            samples = self.samples.get(employee_code) if append else np.zeros((0, new.shape[1]), dtype=np.float32)
+            samples = np.vstack([samples, new])[-config.MAX_ENROLLMENT_PHOTOS:]
+
+            mean, medoids = build_template(samples, config.TEMPLATE_MEDOIDS)
+            self.samples.upsert(employee_code, samples)
+            self.medoids.upsert(employee_code, medoids)
+            self.means.upsert(employee_code, mean)
+
+    def merge(self, embeddings: np.ndarray, codes: List[str], append: bool = False):
+        """
+        Add the photo embeddings of many employees with a single rebuild (bulk enrollment)
+        append=False replaces those employees' existing photos; append=True keeps them, oldest first
+        """
+        new_codes = set(codes)
+        with self._lock:
+            old_codes = self.samples.codes.tolist()
+            keep = [i for i, code in enumerate(old_codes) if append or code not in new_codes]
+            parts = [self.samples.embeddings[keep]] if keep else []
+            self.rebuild(np.vstack(parts + [np.atleast_2d(embeddings)]), [old_codes[i] for i in keep] + list(codes))
+
+    def remove(self, employee_code: str) -> bool:
+        with self._lock:
+            self.samples.remove(employee_code)
+            self.medoids.remove(employee_code)
+            return self.means.remove(employee_code)
+
+    def retrain(self, min_changes: int = 0) -> bool:
+        return self.means.retrain(min_changes)
+
+    def _best_distance(self, employee_code: str, probe: np.ndarray, mean_distance: float) -> float:
+        medoid_distance = self.medoids.verify(employee_code, probe)
+        if medoid_distance is None:
+            return mean_distance
+        return min(mean_distance, medoid_distance)
+
+    def search(self, embedding, top_k: int = 1) -> List[Tuple[str, float]]:
+        return self.search_many(np.asarray(embedding).reshape(1, -1), top_k)[0]
+
+    def search_many(self, embeddings, top_k: int = 1) -> List[List[Tuple[str, float]]]:
+        """
+        Search the per-employee means, then rescore the best TEMPLATE_RESCORE_K
+        employees against their medoids
+        Returns: one list of (employee_code, distance) per probe, sorted by distance
+        """
+        probes = EmbeddingIndex.normalize(np.atleast_2d(embeddings))
+        coarse = self.means.search_many(probes, max(top_k, config.TEMPLATE_RESCORE_K))
+        results = []
+        for probe, candidates in zip(probes, coarse):
+            rescored = [
+                (code, self._best_distance(code, probe, distance))
+                for code, distance in candidates
+            ]
+            rescored.sort(key=lambda match: match[1])
+            results.append(rescored[:top_k])
+        return results
+
+    def verify(self, employee_code: str, embedding) -> Optional[float]:
+        """1:1 distance to one employee's template (mean and medoids)"""
+        mean_distance = self.means.verify(employee_code, embedding)
+        if mean_distance is None:
+            return None
+        probe = EmbeddingIndex.normalize(np.asarray(embedding).reshape(-1))
+        return self._best_distance(employee_code, probe, mean_distance)
+
+
+def write_enrollment_batch(path: Path, embeddings: np.ndarray, codes: List[str], append: bool):
+    """Write a bulk enrollment batch for the service to merge (temp file, then rename)"""
+    temp_path = Path(str(path) + ".tmp")
+    with open(temp_path, 'wb') as f:
+        np.savez(f, embeddings=np.asarray(embeddings, dtype=np.float32), codes=np.asarray(codes, dtype=str),
+                 append=np.asarray(append))
+    os.replace(temp_path, path)
+
+
+def read_enrollment_batch(path: Path) -> Tuple[np.ndarray, List[str], bool]:
+    with np.load(path, allow_pickle=False) as batch:
+        return batch['embeddings'], batch['codes'].tolist(), bool(batch['append'])
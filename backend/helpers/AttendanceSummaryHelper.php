@@ -0,0 +1,61 @@
+<?php
+/**
+ * Attendance Summary Helper
+ * Keeps attendance_monthly_summary (read by the face recognition service for
+ * attendance statistics) in step with attendance rows written by this API
+ */
+
+class AttendanceSummaryHelper {
+    private $db;
+    
+    public function __construct($db) {
+        $this->db = $db;
+    }
+    
+    /**
+     * Recompute one employee's summary for the month containing $date
+     * Only that employee-month is touched, so other summary rows (and their updated_at) stay as they are
+     */
+    public function refresh($employeeId, $date) {
+        $start = date('Y-m-01', strtotime($date));
+        $end = date('Y-m-01', strtotime($start . ' +1 month'));
+        $year = (int)date('Y', strtotime($start));
+        $month = (int)date('n', strtotime($start));
+        
+        try {
+            $ownTransaction = !$this->db->inTransaction();
+            if ($ownTransaction) {
+                $this->db->beginTransaction();
+            }
+            
+            $stmt = $this->db->prepare("
+                DELETE FROM attendance_monthly_summary
+                WHERE employee_id = ? AND year = ? AND month = ?
+            ");
+            $stmt->execute([$employeeId, $year, $month]);
+            
+            $stmt = $this->db->prepare("
+                INSERT INTO attendance_monthly_summary
+                (employee_id, year, month, total_days, present_days, late_days, absent_days, total_hours, total_overtime)
+                SELECT employee_id, ?, ?, COUNT(*),
+                    SUM(status = 'present'), SUM(status = 'late'), SUM(status = 'absent'),
+                    COALESCE(SUM(actual_hours), 0), COALESCE(SUM(overtime_hours), 0)
+                FROM attendance
+                WHERE employee_id = ? AND attendance_date >= ? AND attendance_date < ?
+                GROUP BY employee_id
+            ");
+            $stmt->execute([$year, $month, $employeeId, $start, $end]);
+            
+            if ($ownTransaction) {
+                $this->db->commit();
+            }
+            return true;
+        } catch (Exception $e) {
+            if ($ownTransaction && $this->db->inTransaction()) {
+                $this->db->rollBack();
+            }
+            error_log("Error refreshing attendance summary: " . $e->getMessage());
+            return false;
+        }
+    }
+}
@@ -142,6 +142,36 @@ INSERT INTO `attendance` (`attendance_id`, `employee_id`, `shift_id`, `attendanc
 
 -- --------------------------------------------------------
 
+--
+-- Cấu trúc bảng cho bảng `attendance_monthly_summary`
+--
+
+CREATE TABLE `attendance_monthly_summary` (
+  `employee_id` int(11) NOT NULL,
+  `year` smallint(6) NOT NULL,
+  `month` tinyint(4) NOT NULL,
+  `total_days` int(11) NOT NULL DEFAULT 0,
+  `present_days` int(11) NOT NULL DEFAULT 0,
+  `late_days` int(11) NOT NULL DEFAULT 0,
+  `absent_days` int(11) NOT NULL DEFAULT 0,
+  `total_hours` decimal(8,2) NOT NULL DEFAULT 0.00,
+  `total_overtime` decimal(8,2) NOT NULL DEFAULT 0.00,
+  `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp()
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Per-employee monthly attendance totals, maintained by the face recognition service';
+
+--
+-- Đang đổ dữ liệu cho bảng `attendance_monthly_summary`
+--
+
+INSERT INTO `attendance_monthly_summary` (`employee_id`, `year`, `month`, `total_days`, `present_days`, `late_days`, `absent_days`, `total_hours`, `total_overtime`)
+SELECT `employee_id`, YEAR(`attendance_date`), MONTH(`attendance_date`), COUNT(*),
+       SUM(`status` = 'present'), SUM(`status` = 'late'), SUM(`status` = 'absent'),
+       COALESCE(SUM(`actual_hours`), 0), COALESCE(SUM(`overtime_hours`), 0)
+FROM `attendance`
+GROUP BY `employee_id`, YEAR(`attendance_date`), MONTH(`attendance_date`);
+
+-- --------------------------------------------------------
+
 --
 -- Cấu trúc bảng cho bảng `deductions`
 --
@@ -756,10 +786,18 @@ ALTER TABLE `attendance`
   ADD KEY `shift_id` (`shift_id`),
   ADD KEY `idx_employee_date` (`employee_id`,`attendance_date`),
   ADD KEY `idx_date` (`attendance_date`),
+  ADD KEY `idx_date_updated` (`attendance_date`,`updated_at`),
   ADD KEY `idx_status` (`status`),
   ADD KEY `idx_check_in_photo` (`check_in_photo`),
   ADD KEY `idx_check_out_photo` (`check_out_photo`);
 
+--
+-- Chỉ mục cho bảng `attendance_monthly_summary`
+--
+ALTER TABLE `attendance_monthly_summary`
+  ADD PRIMARY KEY (`employee_id`,`year`,`month`),
+  ADD KEY `idx_year_month_updated` (`year`,`month`,`updated_at`);
+
 --
 -- Chỉ mục cho bảng `deductions`
 --
@@ -789,7 +827,8 @@ ALTER TABLE `employees`
   ADD KEY `idx_status` (`status`),
   ADD KEY `idx_name` (`full_name`),
   ADD KEY `idx_email` (`email`),
-  ADD KEY `idx_face_photo` (`face_photo`);
+  ADD KEY `idx_face_photo` (`face_photo`),
+  ADD KEY `idx_updated` (`updated_at`);
 
 --
 -- Chỉ mục cho bảng `employee_allowances`
@@ -1029,6 +1068,12 @@ ALTER TABLE `attendance`
   ADD CONSTRAINT `attendance_ibfk_1` FOREIGN KEY (`employee_id`) REFERENCES `employees` (`employee_id`) ON DELETE CASCADE,
   ADD CONSTRAINT `attendance_ibfk_2` FOREIGN KEY (`shift_id`) REFERENCES `work_shifts` (`shift_id`) ON DELETE SET NULL;
 
+--
+-- Các ràng buộc cho bảng `attendance_monthly_summary`
+--
+ALTER TABLE `attendance_monthly_summary`
+  ADD CONSTRAINT `attendance_monthly_summary_ibfk_1` FOREIGN KEY (`employee_id`) REFERENCES `employees` (`employee_id`) ON DELETE CASCADE;
+
 --
 -- Các ràng buộc cho bảng `departments`
 --